@@ -0,0 +1,131 @@
+"""Poll + heartbeat + ingest throughput of server.py with stock vs tuned SQLite.
+
+Each mode runs in its own subprocess against a fresh temporary database:
+
+    python benchmark_sqlite.py [--workers 8] [--seconds 10] [--questions 20]
+
+Every worker thread loops: queue a job, /api/poll it, /api/heartbeat, then
+/api/upload_results with --questions questions (ingested in the background).
+req/s counts only accepted requests; uploads refused with 503 while the ingest
+backlog is full are reported separately, and questions/s is measured once the
+backlog has drained.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+def run_workload(workers, seconds, questions_per_job):
+    import server
+
+    server.start_background_threads()
+    client = server.app.test_client()
+    counts = {"cycles": 0, "requests": 0, "errors": 0, "backlogged": 0}  # requests: accepted ones only
+    counts_lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def worker(n):
+        pc_id = f"bench-pc-{n}"
+        cycle = 0
+        while time.monotonic() < deadline:
+            requests_done = errors = backlogged = 0
+            try:
+                db = server.SessionLocal()
+                try:
+                    with server.app.app_context():
+                        server.enqueue_job(db, "bench.pdf", "bench.pdf", {})
+                finally:
+                    db.close()
+
+                r = client.get(f"/api/poll?pc_id={pc_id}")
+                requests_done += r.status_code == 200
+                job = r.get_json() or {}
+                errors += r.status_code != 200
+
+                r = client.post("/api/heartbeat", json={"pc_id": pc_id})
+                requests_done += r.status_code == 200
+                errors += r.status_code != 200
+
+                if job.get("job_id"):
+                    questions = [
+                        {"question": f"{pc_id} cycle {cycle} question {i}", "answer": "A"}
+                        for i in range(questions_per_job)
+                    ]
+                    r = client.post("/api/upload_results", json={"job_id": job["job_id"], "questions": questions})
+                    requests_done += r.status_code in (200, 202)
+                    backlogged += r.status_code == 503  # ingest backlog full; a real PC retries later
+                    errors += r.status_code not in (200, 202, 503)
+            except Exception:
+                errors += 1
+            cycle += 1
+            with counts_lock:
+                counts["cycles"] += 1
+                counts["requests"] += requests_done
+                counts["errors"] += errors
+                counts["backlogged"] += backlogged
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    # Accepted uploads are still being ingested; wait for them so questions/s is real writes
+    db = server.SessionLocal()
+    try:
+        while db.query(server.ResultUpload).filter(server.UNFINISHED_UPLOAD).count():
+            time.sleep(0.1)
+        stored = db.query(server.Question).count()
+    finally:
+        db.close()
+    drained = time.monotonic() - started
+
+    counts["requests_per_sec"] = round(counts["requests"] / elapsed, 1)
+    counts["cycles_per_sec"] = round(counts["cycles"] / elapsed, 1)
+    counts["questions_per_sec"] = round(stored / drained, 1)
+    print(json.dumps(counts))
+
+
+def run_mode(tuned, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DB_PATH=os.path.join(tmp, "bench.db"),
+            SQLITE_TUNED="1" if tuned else "0",
+            MASTERS_SYNC_INTERVAL="0",
+        )
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--workers", str(args.workers),
+             "--seconds", str(args.seconds), "--questions", str(args.questions)],
+            env=env, cwd=tmp, capture_output=True, text=True, check=True
+        ).stdout
+        return json.loads(out.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        run_workload(args.workers, args.seconds, args.questions)
+        sys.exit(0)
+
+    print(f"🏁 {args.workers} workers x {args.seconds}s, {args.questions} questions per job")
+    for label, tuned in (("stock", False), ("tuned", True)):
+        result = run_mode(tuned, args)
+        print(f"📊 {label:>5}: {result['requests_per_sec']} accepted req/s, "
+              f"{result['cycles_per_sec']} cycles/s, {result['questions_per_sec']} questions stored/s, "
+              f"{result['errors']} errors, "
+              f"{result['backlogged']} uploads refused while the ingest backlog was full")
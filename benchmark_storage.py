@@ -0,0 +1,53 @@
+"""Timings for every storage.py backend, after its conformance checks (check_storage.py).
+
+    python benchmark_storage.py [--jobs 2000] [--questions 20]
+
+memory and sqlite (a temporary file) always run. mysql runs when STORAGE_MYSQL_URL
+is set (use an empty scratch database), mongo when MONGO_URI is set.
+"""
+import argparse
+import tempfile
+import time
+import uuid
+
+from check_storage import backends, check_backend
+
+
+def timed(label, n, fn):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"   {label:<10} {n / elapsed:>10.0f} ops/s")
+
+
+def benchmark(store, jobs, questions_per_job):
+    job_ids = []
+    timed("add_job", jobs, lambda: job_ids.extend(store.add_job("p.pdf", "uploads/p.pdf")["job_id"] for _ in range(jobs)))
+    timed("claim_job", jobs, lambda: [store.claim_job("bench") for _ in range(jobs)])
+    run = uuid.uuid4().hex
+    timed("ingest", jobs * questions_per_job, lambda: [
+        store.complete_job(job_id, [{"question": f"{run} {job_id} q{i}", "answer": "A"} for i in range(questions_per_job)], "")
+        for job_id in job_ids
+    ])
+    timed("list_jobs", 10, lambda: [store.list_jobs() for _ in range(10)])
+    timed("counts", 100, lambda: [store.status_counts() for _ in range(100)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=20)
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, make_store in backends(tmp):
+            try:
+                check_backend(make_store)
+                print(f"✅ {name}: conformance OK")
+            except AssertionError as e:
+                failures += 1
+                print(f"❌ {name}: {e}")
+                continue
+            benchmark(make_store(), args.jobs, args.questions)
+    raise SystemExit(1 if failures else 0)
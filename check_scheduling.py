@@ -0,0 +1,85 @@
+"""Checks that server.py schedules by the throughput it measures.
+
+    python check_scheduling.py
+
+Runs server.py in-process against a temporary database: two PCs send heartbeats, one
+of them polls without ?pc_id= (so its jobs are leased under its address), both finish a
+job, and the next polls must rank them by the pages/min measured from those jobs.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+FAST = {'REMOTE_ADDR': '10.0.0.1'}
+SLOW = {'REMOTE_ADDR': '10.0.0.2'}
+
+
+def queue_pdf(server, folder, pages):
+    path = os.path.join(folder, f"{pages}-{datetime.now().timestamp()}.pdf")
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4\n" + b"<< /Type /Page >>\n" * pages)
+    db = server.SessionLocal()
+    try:
+        with server.app.app_context():
+            return server.enqueue_job(db, os.path.basename(path), path, {}).get_json()['job_id']
+    finally:
+        db.close()
+
+
+def finish(server, client, job_id, minutes, environ):
+    """Upload results as if the job had been processing for `minutes`"""
+    db = server.SessionLocal()
+    try:
+        db.get(server.Job, job_id).processed_at = datetime.now() - timedelta(minutes=minutes)
+        db.commit()
+    finally:
+        db.close()
+    r = client.post('/api/upload_results', json={'job_id': job_id, 'questions': []}, environ_base=environ)
+    assert r.status_code == 202, f"upload_results answered {r.status_code}"
+
+
+def check_scheduling(server, folder):
+    client = server.app.test_client()
+    client.post('/api/heartbeat', json={'pc_id': 'gpu-box'}, environ_base=FAST)
+    client.post('/api/heartbeat', json={'pc_id': 'laptop'}, environ_base=SLOW)
+
+    # Measure both PCs on a 10-page job: gpu-box takes 1 minute, laptop 10
+    queue_pdf(server, folder, 10)
+    queue_pdf(server, folder, 10)
+    fast_job = client.get('/api/poll', environ_base=FAST).get_json()['job_id']  # no ?pc_id=
+    slow_job = client.get('/api/poll?pc_id=laptop', environ_base=SLOW).get_json()['job_id']
+    finish(server, client, fast_job, 1, FAST)
+    finish(server, client, slow_job, 10, SLOW)
+
+    rates = {p['pc_id']: p['pages_per_minute'] for p in client.get('/api/pc_status').get_json()}
+    assert rates['gpu-box'] and abs(rates['gpu-box'] - 10) < 0.5, f"gpu-box measured at {rates['gpu-box']} pages/min"
+    assert rates['laptop'] and abs(rates['laptop'] - 1) < 0.1, f"laptop measured at {rates['laptop']} pages/min"
+
+    sizes = {queue_pdf(server, folder, pages): pages for pages in (5, 200, 20, 50)}
+    fast_pick = sizes[client.get('/api/poll', environ_base=FAST).get_json()['job_id']]
+    slow_pick = sizes[client.get('/api/poll?pc_id=laptop', environ_base=SLOW).get_json()['job_id']]
+    assert fast_pick == 200, f"fastest PC got the {fast_pick}-page job"
+    assert slow_pick == 5, f"slowest PC got the {slow_pick}-page job"
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(
+            DB_PATH=os.path.join(tmp, "check.db"),
+            MMD_FOLDER=os.path.join(tmp, "mmd"),
+            INGEST_FOLDER=os.path.join(tmp, "ingest"),
+            MASTERS_SYNC_INTERVAL="0",
+            HEARTBEAT_FLUSH_INTERVAL="3600",
+        )
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import server
+
+        server.PdfReader = None  # the test PDFs only carry page markers
+        server.start_background_threads()
+        try:
+            check_scheduling(server, tmp)
+        except AssertionError as e:
+            print(f"❌ scheduling: {e}")
+            raise SystemExit(1)
+        print("✅ scheduling: measured throughput drives job assignment")
@@ -0,0 +1,146 @@
+"""Checks that every storage.py backend behaves the same, and that server.py serves its jobs.
+
+    python check_storage.py
+
+memory and sqlite (a temporary file) always run. mysql runs when STORAGE_MYSQL_URL
+is set (use an empty scratch database), mongo when MONGO_URI is set. Exits 1 on the
+first mismatch of any backend.
+"""
+import os
+import sys
+import tempfile
+import threading
+import uuid
+
+from storage import MemoryStore, MongoStore, SQLStore
+
+
+def check_conformance(store):
+    """Behaviour every backend must share; raises AssertionError on the first mismatch"""
+    assert store.claim_job("pc-1") is None, "empty queue must claim nothing"
+
+    first = store.add_job("a.pdf", "uploads/a.pdf", {"marks": 4})
+    second = store.add_job("b.pdf", "uploads/b.pdf")
+    assert store.get_job(first["job_id"])["status"] == "queued"
+    assert store.get_job(first["job_id"])["priority"] == 0, "jobs are normal priority by default"
+    assert store.get_job("missing") is None
+
+    claimed = store.claim_job("pc-1")
+    assert claimed["job_id"] == first["job_id"], "oldest queued job is claimed first"
+    assert claimed["status"] == "processing" and claimed["pc_processor"] == "pc-1"
+    assert store.claim_job("pc-2")["job_id"] == second["job_id"]
+    assert store.claim_job("pc-3") is None
+
+    questions = [
+        {"question": " What is 2+2? ", "answer": "4"},
+        {"question": "what is 2+2?", "answer": "4 "},  # duplicate after normalization
+        {"question": "Capital of France?", "answer": "Paris", "marks": 1},
+    ]
+    assert store.complete_job(first["job_id"], questions, "# mmd") == 2
+    done = store.get_job(first["job_id"])
+    assert done["status"] == "completed" and done["questions_count"] == 2 and done["mmd_content"] == "# mmd"
+    assert store.complete_job(second["job_id"], questions[:1], "") == 0, "already stored questions are skipped"
+
+    failed = store.add_job("c.pdf", "uploads/c.pdf")
+    store.fail_job(failed["job_id"], "boom")
+    assert store.get_job(failed["job_id"])["status"] == "error"
+    assert store.claim_job("pc-1") is None, "failed jobs are not claimable"
+    assert store.status_counts() == {"completed": 2, "error": 1}
+
+    assert [j["job_id"] for j in store.list_jobs()][:1] == [failed["job_id"]], "jobs are listed newest first"
+    listed = store.list_questions()
+    assert len(listed) == 2 and all(q["question_id"] for q in listed)
+
+    store.record_heartbeat("pc-1")
+    store.record_heartbeat("pc-1")
+    processors = store.list_processors()
+    assert [p["pc_id"] for p in processors] == ["pc-1"] and processors[0]["status"] == "online"
+
+
+def check_priority_order(store):
+    """Higher priority first, oldest first within a level"""
+    low = store.add_job("low.pdf", "uploads/low.pdf", {"priority": "low"})
+    normal = store.add_job("normal.pdf", "uploads/normal.pdf")
+    urgent = store.add_job("urgent.pdf", "uploads/urgent.pdf", {"priority": "urgent"})
+    later = store.add_job("later.pdf", "uploads/later.pdf", {"priority": "normal"})
+    assert store.get_job(urgent["job_id"])["priority"] == 2
+    order = [store.claim_job("pc-1")["job_id"] for _ in range(4)]
+    expected = [urgent["job_id"], normal["job_id"], later["job_id"], low["job_id"]]
+    assert order == expected, "jobs are claimed by priority, then oldest first"
+
+
+def check_concurrent_claims(store, jobs=50, workers=8):
+    """No job may be handed to two pollers"""
+    for _ in range(jobs):
+        store.add_job("c.pdf", "uploads/c.pdf")
+    claimed = []
+    claimed_lock = threading.Lock()
+
+    def poller(n):
+        while True:
+            job = store.claim_job(f"pc-{n}")
+            if job is None:
+                return
+            with claimed_lock:
+                claimed.append(job["job_id"])
+
+    threads = [threading.Thread(target=poller, args=(n,)) for n in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(claimed) == len(set(claimed)) == jobs, "every job claimed exactly once"
+
+
+def check_server_dispatch(tmp):
+    """Jobs queued through SQLStore on server.py's app.db are dispatched by /api/poll in priority order"""
+    os.environ.update(
+        DB_PATH=os.path.join(tmp, "server.db"),
+        MMD_FOLDER=os.path.join(tmp, "mmd"),
+        INGEST_FOLDER=os.path.join(tmp, "ingest"),
+        MASTERS_SYNC_INTERVAL="0",
+    )
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import server
+
+    store = SQLStore(f"sqlite:///{os.environ['DB_PATH']}")
+    normal = store.add_job("normal.pdf", "uploads/normal.pdf")
+    high = store.add_job("high.pdf", "uploads/high.pdf", {"priority": "high"})
+    client = server.app.test_client()
+    order = [client.get("/api/poll?pc_id=pc-1").get_json().get("job_id") for _ in range(3)]
+    assert order == [high["job_id"], normal["job_id"], None], f"server.py dispatched {order}"
+    assert store.get_job(normal["job_id"])["queue_key"] == "default", "server.py tags jobs queued by SQLStore"
+
+
+def backends(tmp):
+    yield "memory", MemoryStore
+    yield "sqlite", lambda: SQLStore(f"sqlite:///{os.path.join(tmp, f'{uuid.uuid4().hex}.db')}")
+    if os.getenv("STORAGE_MYSQL_URL"):
+        yield "mysql", lambda: SQLStore(os.getenv("STORAGE_MYSQL_URL"))
+    if os.getenv("MONGO_URI"):
+        yield "mongo", lambda: MongoStore(os.getenv("MONGO_URI"), database=f"check_{uuid.uuid4().hex[:8]}")
+
+
+def check_backend(make_store):
+    check_conformance(make_store())
+    check_priority_order(make_store())
+    check_concurrent_claims(make_store())
+
+
+if __name__ == "__main__":
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, make_store in backends(tmp):
+            try:
+                check_backend(make_store)
+                print(f"✅ {name}: conformance OK")
+            except AssertionError as e:
+                failures += 1
+                print(f"❌ {name}: {e}")
+        try:
+            check_server_dispatch(tmp)
+            print("✅ server.py: dispatches jobs queued through SQLStore")
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ server.py: {e}")
+    raise SystemExit(1 if failures else 0)
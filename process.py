@@ -1,12 +1,14 @@
 from flask import Flask, request, render_template, jsonify, send_from_directory
 import os
-import uuid
 import json
+import threading
 from datetime import datetime
 from werkzeug.utils import secure_filename
-from sqlalchemy import create_engine, Column, String, Integer, DateTime, Text, func
+from sqlalchemy import create_engine, event, Column, String, Integer, DateTime
+from sqlalchemy.engine import URL
 from sqlalchemy.orm import declarative_base, sessionmaker
-import pymysql
+
+from storage import SQLStore
 
 # =========================
 # CONFIG (SQL, no Mongo)
@@ -19,25 +21,6 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
-class Job(Base):
-    __tablename__ = "jobs"
-
-    job_id = Column(String, primary_key=True, index=True)
-    filename = Column(String, nullable=False)
-    filepath = Column(String, nullable=False)
-    status = Column(String, default="queued")
-    created_at = Column(DateTime, default=datetime.utcnow)
-    processed_at = Column(DateTime, nullable=True)
-    completed_at = Column(DateTime, nullable=True)
-    error_message = Column(Text, nullable=True)
-    questions_count = Column(Integer, default=0)
-    pc_processor = Column(String, nullable=True)
-    mmd_content = Column(Text, nullable=True)
-
-    # 👇 Add this line
-    job_metadata = Column(Text, nullable=True)  # JSON string
-
-
 # Master Tables
 class ChapterMaster(Base):
     __tablename__ = "chapter_master"
@@ -108,56 +91,12 @@ class YearOfAppearanceMaster(Base):
     year = Column(Integer, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
-class Question(Base):
-    __tablename__ = "questions"
-
-    # Primary key matching target schema
-    question_id = Column(Integer, primary_key=True, autoincrement=True)
-    job_id = Column(String, index=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-    # Core question fields
-    question = Column(Text)
-    option1 = Column(Text)
-    option2 = Column(Text)
-    option3 = Column(Text)
-    option4 = Column(Text)
-    answer = Column(Text)
-    explanation = Column(Text)
-    solution = Column(Text)
-    
-    # Status and metadata fields
-    asked = Column(String)
-    asked_status = Column(String)
-    date = Column(DateTime)
-    marks = Column(Integer)
-    question_category = Column(String)
-    status = Column(String)
-
-    # Foreign key fields matching target schema
-    chapter_master_chapter_id = Column(Integer)
-    entrance_exam_master_entrance_exam_id = Column(Integer)
-    pattern_master_pattern_id = Column(Integer)
-    question_level_question_level_id = Column(Integer)
-    question_type_question_type_id = Column(Integer)
-    standard_master_standard_id = Column(Integer)
-    sub_topic_master_sub_topic_id = Column(Integer)
-    subject_master_subject_id = Column(Integer)
-    topic_master_topic_id = Column(Integer)
-    user_id = Column(Integer)
-    year_of_appearance_year_of_appearance_id = Column(Integer)
-
-
-class PCProcessor(Base):
-    __tablename__ = "pc_processors"
-
-    pc_id = Column(String, primary_key=True)
-    last_heartbeat = Column(DateTime, default=datetime.utcnow)
-    status = Column(String, default="online")
-
 
 Base.metadata.create_all(bind=engine)
 
+# Jobs, questions and PC processors go through the shared job queue storage
+store = SQLStore(DATABASE_URL)
+
 
 # =========================
 # FLASK APP
@@ -192,6 +131,20 @@ def get_chapters_by_subject(subject_id):
         db.close()
 
 
+@app.route('/api/chapters_by_subject', methods=['GET'])
+def get_all_chapters_by_subject():
+    db = SessionLocal()
+    try:
+        chapters = db.query(ChapterMaster).order_by(ChapterMaster.chapter_name.asc()).all()
+        data = {}
+        for c in chapters:
+            if c.subject_master_subject_id is not None:
+                data.setdefault(c.subject_master_subject_id, []).append({"id": c.chapter_id, "name": c.chapter_name})
+        return jsonify(data)
+    finally:
+        db.close()
+
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
@@ -202,108 +155,77 @@ def upload_file():
         return jsonify({'error': 'No file selected'}), 400
 
     if file and allowed_file(file.filename):
-        db = SessionLocal()
-        try:
-            job_id = str(uuid.uuid4())
-            filename = secure_filename(file.filename)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{timestamp}_{filename}"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-
-            # Extract metadata from form
-            metadata = {}
-            metadata_fields = [
-                'question_category', 'marks', 'subject_master_subject_id', 'chapter_master_chapter_id',
-                'standard_master_standard_id', 'question_level_question_level_id', 'entrance_exam_master_entrance_exam_id',
-                'pattern_master_pattern_id', 'question_type_question_type_id', 'year_of_appearance_year_of_appearance_id',
-                'topic_master_topic_id', 'sub_topic_master_sub_topic_id', 'user_id', 'asked_status',
-                'asked', 'status'
-            ]
-            
-            for field in metadata_fields:
-                value = request.form.get(field)
-                if value:
-                    # Convert numeric fields
-                    if field in ['marks', 'subject_master_subject_id', 'chapter_master_chapter_id', 
-                               'standard_master_standard_id', 'question_level_question_level_id',
-                               'entrance_exam_master_entrance_exam_id', 'pattern_master_pattern_id',
-                               'question_type_question_type_id', 'year_of_appearance_year_of_appearance_id',
-                               'topic_master_topic_id', 'sub_topic_master_sub_topic_id', 'user_id']:
-                        try:
-                            metadata[field] = int(value)
-                        except ValueError:
-                            metadata[field] = None
-                    else:
-                        metadata[field] = value
-
-            job = Job(
-                job_id=job_id,
-                filename=filename,
-                filepath=filepath,
-                status="queued",
-                created_at=datetime.now()
-            )
-            db.add(job)
-            db.commit()
-
-            # Store metadata in job_metadata field (as JSON)
-            job.job_metadata = json.dumps(metadata)
-            db.commit()
-
-            return jsonify({
-                'job_id': job_id,
-                'message': 'PDF uploaded successfully! Added to processing queue.',
-                'status': 'queued',
-                'metadata': metadata
-            })
-        finally:
-            db.close()
+        filename = secure_filename(file.filename)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"{timestamp}_{filename}"
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        file.save(filepath)
+
+        # Extract metadata from form
+        metadata = {}
+        metadata_fields = [
+            'question_category', 'marks', 'subject_master_subject_id', 'chapter_master_chapter_id',
+            'standard_master_standard_id', 'question_level_question_level_id', 'entrance_exam_master_entrance_exam_id',
+            'pattern_master_pattern_id', 'question_type_question_type_id', 'year_of_appearance_year_of_appearance_id',
+            'topic_master_topic_id', 'sub_topic_master_sub_topic_id', 'user_id', 'asked_status',
+            'asked', 'status'
+        ]
+        
+        for field in metadata_fields:
+            value = request.form.get(field)
+            if value:
+                # Convert numeric fields
+                if field in ['marks', 'subject_master_subject_id', 'chapter_master_chapter_id', 
+                           'standard_master_standard_id', 'question_level_question_level_id',
+                           'entrance_exam_master_entrance_exam_id', 'pattern_master_pattern_id',
+                           'question_type_question_type_id', 'year_of_appearance_year_of_appearance_id',
+                           'topic_master_topic_id', 'sub_topic_master_sub_topic_id', 'user_id']:
+                    try:
+                        metadata[field] = int(value)
+                    except ValueError:
+                        metadata[field] = None
+                else:
+                    metadata[field] = value
+
+        job = store.add_job(filename, filepath, metadata)
+
+        return jsonify({
+            'job_id': job['job_id'],
+            'message': 'PDF uploaded successfully! Added to processing queue.',
+            'status': 'queued',
+            'metadata': metadata
+        })
     else:
         return jsonify({'error': 'Invalid file type. Please upload a PDF file.'}), 400
 
 
 @app.route('/status/<job_id>')
 def get_status(job_id):
-    db = SessionLocal()
-    try:
-        job = db.query(Job).filter(Job.job_id == job_id).first()
-        if not job:
-            return jsonify({'error': 'Job not found'}), 404
-        return jsonify({
-            'job_id': job.job_id,
-            'filename': job.filename,
-            'filepath': job.filepath,
-            'status': job.status,
-            'created_at': job.created_at.isoformat() if job.created_at else None,
-            'processed_at': job.processed_at.isoformat() if job.processed_at else None,
-            'completed_at': job.completed_at.isoformat() if job.completed_at else None,
-            'error_message': job.error_message,
-            'questions_count': job.questions_count,
-            'pc_processor': job.pc_processor
-        })
-    finally:
-        db.close()
+    job = store.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({
+        'job_id': job['job_id'],
+        'filename': job['filename'],
+        'filepath': job['filepath'],
+        'status': job['status'],
+        'created_at': job['created_at'].isoformat() if job['created_at'] else None,
+        'processed_at': job['processed_at'].isoformat() if job['processed_at'] else None,
+        'completed_at': job['completed_at'].isoformat() if job['completed_at'] else None,
+        'error_message': job['error_message'],
+        'questions_count': job['questions_count'],
+        'pc_processor': job['pc_processor']
+    })
 
 
 @app.route('/queue')
 def view_queue():
-    db = SessionLocal()
-    try:
-        jobs = db.query(Job).order_by(Job.created_at.desc()).all()
-        return render_template('queue.html', jobs=jobs)
-    finally:
-        db.close()
+    return render_template('queue.html', jobs=store.list_jobs(), counts=store.status_counts())
 
 
 @app.route('/questions')
 def questions():
-    db = SessionLocal()
-    try:
-        qs = db.query(Question).order_by(Question.created_at.desc()).all()
-        return render_template('questions.html', questions=qs)
-    finally:
-        db.close()
+    return render_template('questions.html', questions=store.list_questions())
 
 
 # ================================
@@ -343,46 +265,94 @@ def get_masters():
 # ================================
 # Masters read-only API (external MySQL)
 # ================================
-@app.route('/api/masters_external', methods=['GET'])
-def get_masters_external():
+EXT_DB_POOL_SIZE = int(os.getenv('EXT_DB_POOL_SIZE', 5))
+
+# One bounded pool shared by every request that reads the external MySQL, created on
+# first use. Connections are pinged before use so dead ones are replaced transparently.
+external_engine = None
+external_engine_lock = threading.Lock()
+external_pool_counters = {"connections_opened": 0, "checkouts": 0}
+
+
+def get_external_engine():
+    global external_engine
     host = os.getenv('EXT_DB_HOST')
-    port = int(os.getenv('EXT_DB_PORT', '3306'))
     user = os.getenv('EXT_DB_USER')
     password = os.getenv('EXT_DB_PASSWORD')
     database = os.getenv('EXT_DB_NAME')
-
     if not all([host, user, password, database]):
-        return jsonify({'error': 'External DB environment variables not set'}), 400
+        return None
+
+    with external_engine_lock:
+        if external_engine is None:
+            external_engine = create_engine(
+                URL.create(
+                    "mysql+pymysql",
+                    username=user,
+                    password=password,
+                    host=host,
+                    port=int(os.getenv('EXT_DB_PORT', '3306')),
+                    database=database
+                ),
+                pool_size=EXT_DB_POOL_SIZE,
+                max_overflow=0,
+                pool_timeout=5,
+                pool_recycle=30 * 60,
+                pool_pre_ping=True,
+                connect_args={"connect_timeout": 5}
+            )
+            event.listen(external_engine, "connect", lambda *args: external_pool_counters.update(
+                connections_opened=external_pool_counters["connections_opened"] + 1))
+            event.listen(external_engine, "checkout", lambda *args: external_pool_counters.update(
+                checkouts=external_pool_counters["checkouts"] + 1))
+        return external_engine
 
-    conn = None
-    try:
-        conn = pymysql.connect(host=host, port=port, user=user, password=password, database=database, cursorclass=pymysql.cursors.DictCursor, read_default_file=None)
-        cur = conn.cursor()
 
-        def fetch(table, id_col, name_col):
-            # Strictly read-only query
-            cur.execute(f"SELECT {id_col} AS id, {name_col} AS name FROM {table} ORDER BY {name_col} ASC")
-            return cur.fetchall()
+@app.route('/api/masters_external', methods=['GET'])
+def get_masters_external():
+    ext_engine = get_external_engine()
+    if ext_engine is None:
+        return jsonify({'error': 'External DB environment variables not set'}), 400
 
-        data = {
-            "subjects": fetch('subject_master', 'subject_id', 'subject_name'),
-            "chapters": fetch('chapter_master', 'chapter_id', 'chapter_name'),
-            "standards": fetch('standard_master', 'standard_id', 'standard_name'),
-            "levels": fetch('question_level_master', 'question_level_id', 'level_name'),
-            "exams": fetch('entrance_exam_master', 'entrance_exam_id', 'exam_name'),
-            "patterns": fetch('pattern_master', 'pattern_id', 'pattern_name'),
-            "types": fetch('question_type_master', 'question_type_id', 'type_name'),
-            "years": fetch('year_of_appearance_master', 'year_of_appearance_id', 'year'),
-            "topics": fetch('topic_master', 'topic_id', 'topic_name'),
-            "sub_topics": fetch('sub_topic_master', 'sub_topic_id', 'sub_topic_name'),
-            "users": fetch('user_master', 'user_id', 'username'),
-        }
+    try:
+        with ext_engine.connect() as conn:
+            def fetch(table, id_col, name_col):
+                # Strictly read-only query
+                result = conn.exec_driver_sql(f"SELECT {id_col} AS id, {name_col} AS name FROM {table} ORDER BY {name_col} ASC")
+                return [dict(row) for row in result.mappings()]
+
+            data = {
+                "subjects": fetch('subject_master', 'subject_id', 'subject_name'),
+                "chapters": fetch('chapter_master', 'chapter_id', 'chapter_name'),
+                "standards": fetch('standard_master', 'standard_id', 'standard_name'),
+                "levels": fetch('question_level_master', 'question_level_id', 'level_name'),
+                "exams": fetch('entrance_exam_master', 'entrance_exam_id', 'exam_name'),
+                "patterns": fetch('pattern_master', 'pattern_id', 'pattern_name'),
+                "types": fetch('question_type_master', 'question_type_id', 'type_name'),
+                "years": fetch('year_of_appearance_master', 'year_of_appearance_id', 'year'),
+                "topics": fetch('topic_master', 'topic_id', 'topic_name'),
+                "sub_topics": fetch('sub_topic_master', 'sub_topic_id', 'sub_topic_name'),
+                "users": fetch('user_master', 'user_id', 'username'),
+            }
         return jsonify(data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
+
+
+@app.route('/api/external_pool_status', methods=['GET'])
+def external_pool_status():
+    """Connection pool stats for the external MySQL, for monitoring"""
+    if external_engine is None:
+        return jsonify({'error': 'External DB pool not in use'}), 404
+    pool = external_engine.pool
+    return jsonify({
+        'pool_size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'checked_in': pool.checkedin(),
+        'overflow': max(0, pool.overflow()),
+        'connections_opened': external_pool_counters['connections_opened'],
+        'checkouts': external_pool_counters['checkouts']
+    })
 
 
 # ================================
@@ -390,32 +360,23 @@ def get_masters_external():
 # ================================
 @app.route('/api/poll', methods=['GET'])
 def poll_for_jobs():
-    db = SessionLocal()
-    try:
-        job = db.query(Job).filter(Job.status == "queued").order_by(Job.created_at.asc()).first()
-        if job:
-            job.status = "processing"
-            job.processed_at = datetime.now()
-            job.pc_processor = request.remote_addr
-            db.commit()
-            
-            # Parse metadata if available
-            metadata = {}
-            if job.job_metadata:
-                try:
-                    metadata = json.loads(job.job_metadata)
-                except json.JSONDecodeError:
-                    metadata = {}
-            
-            return jsonify({
-                "job_id": job.job_id,
-                "filepath": job.filepath,
-                "filename": job.filename,
-                "metadata": metadata
-            })
-        return jsonify({"message": "No jobs available"})
-    finally:
-        db.close()
+    job = store.claim_job(request.remote_addr)
+    if job:
+        # Parse metadata if available
+        metadata = {}
+        if job['job_metadata']:
+            try:
+                metadata = json.loads(job['job_metadata'])
+            except json.JSONDecodeError:
+                metadata = {}
+
+        return jsonify({
+            "job_id": job['job_id'],
+            "filepath": job['filepath'],
+            "filename": job['filename'],
+            "metadata": metadata
+        })
+    return jsonify({"message": "No jobs available"})
 
 
 @app.route('/api/upload_results', methods=['POST'])
@@ -429,95 +390,27 @@ def upload_results():
     if not job_id:
         return jsonify({'error': 'Job ID required'}), 400
 
-    db = SessionLocal()
-    try:
-        job = db.query(Job).filter(Job.job_id == job_id).first()
-        if not job:
-            return jsonify({'error': 'Job not found'}), 404
-
-        if error_message:
-            job.status = "error"
-            job.error_message = error_message
-            job.completed_at = datetime.now()
-            db.commit()
-            return jsonify({'message': 'Error recorded'})
-
-        saved = 0
-        for q in questions:
-            # Duplicate prevention: exact match on normalized question+answer
-            question_text = (q.get('question') or '').strip()
-            answer_text = (q.get('answer') or '').strip()
-            if question_text:
-                existing = db.query(Question).filter(
-                    func.lower(func.trim(Question.question)) == question_text.lower(),
-                    func.lower(func.trim(Question.answer)) == answer_text.lower()
-                ).first()
-                if existing:
-                    continue
-
-            q_row = Question(
-                job_id=job_id,
-                created_at=datetime.now(),
-                question=question_text,
-                option1=q.get('option1', ''),
-                option2=q.get('option2', ''),
-                option3=q.get('option3', ''),
-                option4=q.get('option4', ''),
-                answer=answer_text,
-                explanation=q.get('explanation', ''),
-                solution=q.get('solution', ''),
-                asked=q.get('asked', ''),
-                asked_status=q.get('asked_status', ''),
-                date=q.get('date'),
-                marks=q.get('marks'),
-                question_category=q.get('question_category', ''),
-                status=q.get('status', ''),
-                chapter_master_chapter_id=q.get('chapter_master_chapter_id'),
-                entrance_exam_master_entrance_exam_id=q.get('entrance_exam_master_entrance_exam_id'),
-                pattern_master_pattern_id=q.get('pattern_master_pattern_id'),
-                question_level_question_level_id=q.get('question_level_question_level_id'),
-                question_type_question_type_id=q.get('question_type_question_type_id'),
-                standard_master_standard_id=q.get('standard_master_standard_id'),
-                sub_topic_master_sub_topic_id=q.get('sub_topic_master_sub_topic_id'),
-                subject_master_subject_id=q.get('subject_master_subject_id'),
-                topic_master_topic_id=q.get('topic_master_topic_id'),
-                user_id=q.get('user_id'),
-                year_of_appearance_year_of_appearance_id=q.get('year_of_appearance_year_of_appearance_id')
-            )
-            db.add(q_row)
-            saved += 1
+    if not store.get_job(job_id):
+        return jsonify({'error': 'Job not found'}), 404
 
-        job.status = "completed"
-        job.questions_count = saved
-        job.completed_at = datetime.now()
-        job.mmd_content = mmd_content
-        db.commit()
+    if error_message:
+        store.fail_job(job_id, error_message)
+        return jsonify({'message': 'Error recorded'})
 
-        return jsonify({
-            'message': 'Results uploaded successfully',
-            'questions_count': saved
-        })
-    finally:
-        db.close()
+    # Duplicates (same normalized question+answer) are skipped by the store
+    saved = store.complete_job(job_id, questions, mmd_content)
+    return jsonify({
+        'message': 'Results uploaded successfully',
+        'questions_count': saved
+    })
 
 
 @app.route('/api/heartbeat', methods=['POST'])
 def heartbeat():
     data = request.get_json()
     pc_id = data.get('pc_id', request.remote_addr)
-
-    db = SessionLocal()
-    try:
-        proc = db.query(PCProcessor).filter(PCProcessor.pc_id == pc_id).first()
-        if not proc:
-            proc = PCProcessor(pc_id=pc_id)
-            db.add(proc)
-        proc.last_heartbeat = datetime.now()
-        proc.status = "online"
-        db.commit()
-        return jsonify({'message': 'Heartbeat received'})
-    finally:
-        db.close()
+    store.record_heartbeat(pc_id)
+    return jsonify({'message': 'Heartbeat received'})
 
 
 @app.route('/download/<filename>')
@@ -527,18 +420,13 @@ def download_file(filename):
 
 @app.route('/api/pc_status')
 def pc_status():
-    db = SessionLocal()
-    try:
-        processors = db.query(PCProcessor).all()
-        return jsonify([
-            {
-                'pc_id': p.pc_id,
-                'last_heartbeat': p.last_heartbeat.isoformat() if p.last_heartbeat else None,
-                'status': p.status
-            } for p in processors
-        ])
-    finally:
-        db.close()
+    return jsonify([
+        {
+            'pc_id': p['pc_id'],
+            'last_heartbeat': p['last_heartbeat'].isoformat() if p['last_heartbeat'] else None,
+            'status': p['status']
+        } for p in store.list_processors()
+    ])
 
 
 if __name__ == '__main__':
@@ -1,24 +1,113 @@
-from flask import Flask, request, render_template, jsonify, send_from_directory
+from flask import Flask, Response, request, render_template, jsonify, send_file, send_from_directory, url_for
 import os
+import shutil
 import uuid
+import base64
+import gzip
+import hashlib
 import json
-from datetime import datetime
+import mmap
+import re
+import threading
+import time
+import zlib
+from collections import deque
+from itertools import islice
+from datetime import datetime, timedelta
 from werkzeug.utils import secure_filename
-from sqlalchemy import create_engine, Column, String, Integer, DateTime, Text, func
+from sqlalchemy import create_engine, event, Column, String, Integer, Float, DateTime, Text, Index, and_, bindparam, column, delete, func, insert, inspect, or_, select, table, text, update
+from sqlalchemy.dialects.mysql import match as mysql_match
+from sqlalchemy.engine import URL
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.orm import declarative_base, sessionmaker
 import pymysql
-import mysql.connector
+
+from storage import PRIORITY_LEVELS, job_priority  # shared with storage.py's stores
+
+try:
+    from pypdf import PdfReader  # optional: exact page counts for sharding large PDFs
+except ImportError:
+    PdfReader = None
+
+try:
+    import zstandard  # optional: zstd-encoded result uploads
+except ImportError:
+    zstandard = None
 
 # =========================
 # CONFIG (SQL, no Mongo)
 # =========================
-DB_PATH = os.path.join(os.path.dirname(__file__), "app.db")
+DB_PATH = os.getenv('DB_PATH', os.path.join(os.path.dirname(__file__), "app.db"))
 DATABASE_URL = f"sqlite:///{DB_PATH}"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Tuned mode (default): WAL so readers never block the writer, synchronous=NORMAL (safe
+# under WAL), memory-mapped reads, a busy timeout instead of instant "database is locked",
+# a sized connection pool, and in-process writers queued one at a time (see below).
+# SQLITE_TUNED=0 restores the stock rollback-journal setup.
+SQLITE_TUNED = os.getenv('SQLITE_TUNED', '1') != '0'
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 30))  # seconds
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', 10))
+
+if SQLITE_TUNED:
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=SQLITE_POOL_SIZE,
+        max_overflow=SQLITE_POOL_SIZE,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT}
+    )
+else:
+    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# SQLite allows a single writer at a time. Rather than have concurrent write transactions
+# collide and spin in the busy handler, each connection takes sqlite_writer before its first
+# INSERT/UPDATE/DELETE and gives it back on commit/rollback, so in-process writers queue up
+# while reads (which never take it) stay concurrent. pysqlite only opens the transaction
+# right before that first write, so the writer never upgrades from a stale read snapshot.
+WRITE_STATEMENT = re.compile(r"\s*(INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+sqlite_writer = threading.Lock()
+sqlite_writer_owner = {"thread": None}
+
+
+def release_sqlite_writer(info):
+    if info.pop("holds_writer", False):
+        sqlite_writer_owner["thread"] = None
+        sqlite_writer.release()
+
+
+if SQLITE_TUNED:
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.close()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def acquire_sqlite_writer(conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get("holds_writer") or not WRITE_STATEMENT.match(statement):
+            return
+        if sqlite_writer_owner["thread"] == threading.get_ident():
+            return  # a second connection in the same thread; waiting on ourselves would deadlock
+        # On timeout, carry on unqueued and leave it to SQLite's own busy handling
+        if sqlite_writer.acquire(timeout=SQLITE_BUSY_TIMEOUT):
+            sqlite_writer_owner["thread"] = threading.get_ident()
+            conn.info["holds_writer"] = True
+
+    @event.listens_for(engine, "commit")
+    @event.listens_for(engine, "rollback")
+    def end_sqlite_write(conn):
+        release_sqlite_writer(conn.info)
+
+    @event.listens_for(engine.pool, "checkin")
+    def release_sqlite_writer_on_checkin(dbapi_connection, connection_record):
+        release_sqlite_writer(connection_record.info)  # safety net for connections returned mid-transaction
+
+
 # =========================
 # MYSQL CONFIG (Same as pc_processor.py)
 # =========================
@@ -29,6 +118,39 @@ MYSQL_CONFIG = {
     "password": "elitecodo_pw",
     "database": "elitecodo_db"
 }
+MYSQL_POOL_SIZE = int(os.getenv('MYSQL_POOL_SIZE', 5))
+MYSQL_POOL_TIMEOUT = 5  # seconds to wait for a free pooled connection
+MYSQL_POOL_RECYCLE = 30 * 60  # reconnect before the server's wait_timeout drops idle connections
+
+# One bounded pool shared by every endpoint that reads the remote MySQL: no per-request
+# TCP + auth handshake, and connections are pinged before use so dead ones are replaced.
+mysql_engine = create_engine(
+    URL.create(
+        "mysql+mysqlconnector",
+        username=MYSQL_CONFIG["user"],
+        password=MYSQL_CONFIG["password"],
+        host=MYSQL_CONFIG["host"],
+        port=MYSQL_CONFIG["port"],
+        database=MYSQL_CONFIG["database"]
+    ),
+    pool_size=MYSQL_POOL_SIZE,
+    max_overflow=0,
+    pool_timeout=MYSQL_POOL_TIMEOUT,
+    pool_recycle=MYSQL_POOL_RECYCLE,
+    pool_pre_ping=True,
+    connect_args={"connection_timeout": 5}
+)
+mysql_pool_counters = {"connections_opened": 0, "checkouts": 0}
+
+
+@event.listens_for(mysql_engine, "connect")
+def count_mysql_connect(dbapi_connection, connection_record):
+    mysql_pool_counters["connections_opened"] += 1
+
+
+@event.listens_for(mysql_engine, "checkout")
+def count_mysql_checkout(dbapi_connection, connection_record, connection_proxy):
+    mysql_pool_counters["checkouts"] += 1
 
 
 class Job(Base):
@@ -44,18 +166,56 @@ class Job(Base):
     error_message = Column(Text, nullable=True)
     questions_count = Column(Integer, default=0)
     pc_processor = Column(String, nullable=True)
-    mmd_content = Column(Text, nullable=True)
+    mmd_content = Column(Text, nullable=True)  # legacy; MMD now lives gzipped under MMD_FOLDER
 
     # 👇 Add this line
     job_metadata = Column(Text, nullable=True)  # JSON string
 
+    # Lease held by pc_processor while processing; renewed by its heartbeats
+    lease_expires_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0)
+
+    # SHA-256 of the PDF; the file itself is stored as uploads/<content_sha256>.pdf
+    content_sha256 = Column(String(64), nullable=True, index=True)
+
+    # Counted at upload (drives scheduling); shard_count is set once a large PDF has been
+    # split into page-range JobShards
+    page_count = Column(Integer, nullable=True)
+    shard_count = Column(Integer, nullable=True)
+
+    # Bumped by every UPDATE; /api/queue?since= returns the jobs that changed after a point in time
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    # Dispatch order: higher priority first, then the smallest fair-queuing start tag
+    # (see "Priority and fair-share queues")
+    priority = Column(Integer, default=0)
+    queue_key = Column(String, nullable=True)  # e.g. "user_id=7"; "default" without metadata
+    queue_vtime = Column(Float, nullable=True)
+
+    __table_args__ = (
+        # Serves the "oldest queued job" lookup in claim_jobs()
+        Index("ix_jobs_status_created_at", "status", "created_at"),
+        # /download/<filename> resolves the stored file through the job
+        Index("ix_jobs_filename", "filename"),
+        Index("ix_jobs_updated_at", "updated_at"),
+        # Per-queue depth for /api/queue/stats
+        Index("ix_jobs_status_queue_key", "status", "queue_key"),
+        # One unfinished job per PDF, even when the same file is uploaded twice at once
+        Index("ux_jobs_active_content_sha256", "content_sha256", unique=True,
+              sqlite_where=text("status IN ('queued', 'processing', 'ingesting')")),
+    )
+
+
+# Serves the dispatch ORDER BY in claim_jobs() straight off the index (no sort step)
+Index("ix_jobs_dispatch", Job.status, Job.priority.desc(), Job.queue_vtime, Job.created_at)
+
 
 # Master Tables
 class ChapterMaster(Base):
     __tablename__ = "chapter_master"
     chapter_id = Column(Integer, primary_key=True, autoincrement=True)
     chapter_name = Column(String, nullable=False)
-    subject_master_subject_id = Column(Integer, nullable=False)  # 🔹 add this
+    subject_master_subject_id = Column(Integer, nullable=False, index=True)  # 🔹 add this
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
@@ -159,6 +319,28 @@ class Question(Base):
     user_id = Column(Integer)
     year_of_appearance_year_of_appearance_id = Column(Integer)
 
+    # sha256 of the normalized question+answer; NULL for questions without text
+    content_hash = Column(String(64), nullable=True)
+
+    __table_args__ = (
+        Index("ux_questions_content_hash", "content_hash", unique=True),
+        # Keyset pagination on (created_at, question_id), optionally narrowed by one filter column
+        Index("ix_questions_created_at_id", "created_at", "question_id"),
+        Index("ix_questions_status_created_at_id", "status", "created_at", "question_id"),
+        Index("ix_questions_category_created_at_id", "question_category", "created_at", "question_id"),
+        Index("ix_questions_subject_created_at_id", "subject_master_subject_id", "created_at", "question_id"),
+        Index("ix_questions_chapter_created_at_id", "chapter_master_chapter_id", "created_at", "question_id"),
+    )
+
+
+def question_content_hash(question_text, answer_text):
+    """Duplicate key: case-insensitive, whitespace-trimmed question+answer (None when there is no question)"""
+    question_text = (question_text or '').strip().lower()
+    if not question_text:
+        return None
+    answer_text = (answer_text or '').strip().lower()
+    return hashlib.sha256(f"{question_text}\n{answer_text}".encode("utf-8")).hexdigest()
+
 
 class PCProcessor(Base):
     __tablename__ = "pc_processors"
@@ -166,11 +348,210 @@ class PCProcessor(Base):
     pc_id = Column(String, primary_key=True)
     last_heartbeat = Column(DateTime, default=datetime.utcnow)
     status = Column(String, default="online")
+    capabilities = Column(Text, nullable=True)  # JSON, as last reported in a heartbeat
+    pages_per_minute = Column(Float, nullable=True)  # measured throughput
+
+
+class UploadSession(Base):
+    """A chunked upload in progress; chunks themselves live on disk under UPLOAD_SESSIONS_DIR"""
+    __tablename__ = "upload_sessions"
+
+    upload_id = Column(String, primary_key=True)
+    filename = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=True)  # expected checksum, if the client sent one up front
+    upload_metadata = Column(Text, nullable=True)  # JSON string, becomes Job.job_metadata
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class JobShard(Base):
+    """A page range of a large Job, leased to PC processors independently of the other ranges"""
+    __tablename__ = "job_shards"
+
+    shard_id = Column(String, primary_key=True)  # "<job_id>:<shard_index>"
+    job_id = Column(String, nullable=False, index=True)
+    shard_index = Column(Integer, nullable=False)
+    page_start = Column(Integer, nullable=False)  # 1-based, inclusive
+    page_end = Column(Integer, nullable=False)
+    status = Column(String, default="queued")
+    created_at = Column(DateTime, default=datetime.utcnow)  # the parent job's, so shards keep FIFO order
+    processed_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+    pc_processor = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0)
+
+    # legacy; a completed shard's results now wait under INGEST_FOLDER/shards/ until the merge
+    results = Column(Text, nullable=True)  # JSON list of questions
+    mmd_content = Column(Text, nullable=True)
+
+    __table_args__ = (Index("ix_job_shards_status_created_at", "status", "created_at"),)
+
+
+class ResultUpload(Base):
+    """Results accepted from a PC and waiting for (or done with) background ingestion.
+
+    The payload itself (questions + MMD) is spooled as a gzip file under INGEST_FOLDER.
+    """
+    __tablename__ = "result_uploads"
+
+    upload_id = Column(String, primary_key=True)
+    job_id = Column(String, nullable=False, index=True)
+    shard_id = Column(String, nullable=True)
+    status = Column(String, default="pending")  # [receiving ->] pending -> ingesting -> done | error
+    questions_received = Column(Integer, default=0)
+    questions_saved = Column(Integer, nullable=True)
+    rows_per_sec = Column(Integer, nullable=True)  # question insert rate of the ingest
+    attempts = Column(Integer, default=0)
+    error_message = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_result_uploads_status_created_at", "status", "created_at"),)
+
+
+class MastersSync(Base):
+    """One row, written in the same transaction as a complete MySQL -> SQLite masters sync"""
+    __tablename__ = "masters_sync"
+
+    id = Column(Integer, primary_key=True)
+    synced_at = Column(DateTime, nullable=False)
 
 
 Base.metadata.create_all(bind=engine)
 
 
+def ensure_schema():
+    """create_all() skips tables that already exist, so add any newer columns/indexes to an older app.db"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for tbl in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(tbl.name)}
+            for col in tbl.columns:
+                if col.name not in existing:
+                    col_type = col.type.compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {tbl.name} ADD COLUMN {col.name} {col_type}")
+            for index in tbl.indexes:
+                try:
+                    with conn.begin_nested():
+                        index.create(bind=conn, checkfirst=True)
+                except IntegrityError:
+                    print(f"⚠️ {index.name} not created: existing rows violate it (retried on the next start)")
+
+
+ensure_schema()
+
+
+def backfill_job_updated_at():
+    with engine.begin() as conn:
+        conn.execute(
+            update(Job.__table__)
+            .where(Job.updated_at.is_(None))
+            .values(updated_at=func.coalesce(Job.completed_at, Job.processed_at, Job.created_at))
+        )
+
+
+backfill_job_updated_at()
+
+
+def backfill_question_hashes(batch_size=1000):
+    """Fill content_hash for questions stored before it existed.
+
+    Rows that duplicate an already-hashed question keep a NULL hash, so the unique index holds.
+    """
+    set_hash = (
+        update(Question.__table__)
+        .where(Question.__table__.c.question_id == bindparam("qid"))
+        .values(content_hash=bindparam("hash"))
+    )
+    last_id = 0
+    with engine.begin() as conn:
+        while True:
+            rows = conn.execute(
+                select(Question.question_id, Question.question, Question.answer)
+                .where(Question.content_hash.is_(None), Question.question_id > last_id)
+                .order_by(Question.question_id.asc())
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].question_id
+
+            hashes = {}
+            for r in rows:
+                h = question_content_hash(r.question, r.answer)
+                if h and h not in hashes:
+                    hashes[h] = r.question_id
+            if not hashes:
+                continue
+            taken = set(conn.execute(
+                select(Question.content_hash).where(Question.content_hash.in_(hashes))
+            ).scalars())
+            params = [{"qid": qid, "hash": h} for h, qid in hashes.items() if h not in taken]
+            if params:
+                conn.execute(set_hash, params)
+
+
+backfill_question_hashes()
+
+
+SEARCH_COLUMNS = ("question", "option1", "option2", "option3", "option4", "explanation", "solution")
+
+
+def ensure_search_index():
+    """Create the full-text index over SEARCH_COLUMNS. Returns the backend in use: 'fts5', 'mysql' or 'like'.
+
+    On SQLite this is an external-content FTS5 table kept in sync by triggers, so every
+    insert from upload_results is indexed incrementally in the same transaction.
+    """
+    cols = ", ".join(SEARCH_COLUMNS)
+
+    if engine.dialect.name == "mysql":
+        with engine.begin() as conn:
+            existing = {ix["name"] for ix in inspect(conn).get_indexes("questions")}
+            if "ft_questions_text" not in existing:
+                conn.exec_driver_sql(f"ALTER TABLE questions ADD FULLTEXT INDEX ft_questions_text ({cols})")
+        return "mysql"
+    if engine.dialect.name != "sqlite":
+        return "like"
+
+    new_values = ", ".join(f"new.{c}" for c in SEARCH_COLUMNS)
+    old_values = ", ".join(f"old.{c}" for c in SEARCH_COLUMNS)
+    try:
+        with engine.begin() as conn:
+            created = not conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'questions_fts'"
+            ).first()
+            conn.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5({cols}, "
+                f"content='questions', content_rowid='question_id', tokenize='porter unicode61')"
+            )
+            conn.exec_driver_sql(f"""
+                CREATE TRIGGER IF NOT EXISTS questions_fts_ai AFTER INSERT ON questions BEGIN
+                    INSERT INTO questions_fts(rowid, {cols}) VALUES (new.question_id, {new_values});
+                END""")
+            conn.exec_driver_sql(f"""
+                CREATE TRIGGER IF NOT EXISTS questions_fts_ad AFTER DELETE ON questions BEGIN
+                    INSERT INTO questions_fts(questions_fts, rowid, {cols}) VALUES ('delete', old.question_id, {old_values});
+                END""")
+            conn.exec_driver_sql(f"""
+                CREATE TRIGGER IF NOT EXISTS questions_fts_au AFTER UPDATE OF {cols} ON questions BEGIN
+                    INSERT INTO questions_fts(questions_fts, rowid, {cols}) VALUES ('delete', old.question_id, {old_values});
+                    INSERT INTO questions_fts(rowid, {cols}) VALUES (new.question_id, {new_values});
+                END""")
+            if created:
+                conn.exec_driver_sql("INSERT INTO questions_fts(questions_fts) VALUES ('rebuild')")
+    except OperationalError as e:
+        print(f"⚠️ FTS5 unavailable, question search falls back to LIKE: {e}")
+        return "like"
+    return "fts5"
+
+
+SEARCH_BACKEND = ensure_search_index()
+
+
 # =========================
 # FLASK APP
 # =========================
@@ -188,20 +569,159 @@ def allowed_file(filename):
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    # process.py and web_server.py render the same page without the chunked upload API
+    return render_template('index.html', chunked_uploads=True, max_upload_mb=MAX_UPLOAD_SIZE // (1024 * 1024))
 
 @app.route('/api/chapters_by_subject/<int:subject_id>', methods=['GET'])
 def get_chapters_by_subject(subject_id):
-    db = SessionLocal()
-    try:
-        chapters = db.query(ChapterMaster).filter(
-            ChapterMaster.subject_master_subject_id == subject_id
-        ).order_by(ChapterMaster.chapter_name.asc()).all()
+    return jsonify(chapters_by_subject_map().get(subject_id, []))
+
+
+@app.route('/api/chapters_by_subject', methods=['GET'])
+def get_all_chapters_by_subject():
+    """Every subject's sorted chapter list in one response: {subject_id: [{id, name}, ...]}"""
+    return cached_masters_response("chapters", chapters_by_subject_map)
+
+
+METADATA_FIELDS = [
+    'question_category', 'marks', 'subject_master_subject_id', 'chapter_master_chapter_id',
+    'standard_master_standard_id', 'question_level_question_level_id', 'entrance_exam_master_entrance_exam_id',
+    'pattern_master_pattern_id', 'question_type_question_type_id', 'year_of_appearance_year_of_appearance_id',
+    'topic_master_topic_id', 'sub_topic_master_sub_topic_id', 'user_id', 'asked_status',
+    'asked', 'status', 'priority'
+]
+NUMERIC_METADATA_FIELDS = [
+    'marks', 'subject_master_subject_id', 'chapter_master_chapter_id',
+    'standard_master_standard_id', 'question_level_question_level_id',
+    'entrance_exam_master_entrance_exam_id', 'pattern_master_pattern_id',
+    'question_type_question_type_id', 'year_of_appearance_year_of_appearance_id',
+    'topic_master_topic_id', 'sub_topic_master_sub_topic_id', 'user_id'
+]
+
+
+def metadata_from_form(form):
+    """Extract job metadata from the upload form"""
+    metadata = {}
+    for field in METADATA_FIELDS:
+        value = form.get(field)
+        if value:
+            # Convert numeric fields
+            if field in NUMERIC_METADATA_FIELDS:
+                try:
+                    metadata[field] = int(value)
+                except ValueError:
+                    metadata[field] = None
+            else:
+                metadata[field] = value
+    return metadata
+
+
+def timestamped_filename(original):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"{timestamp}_{secure_filename(original)}"
+
+
+def enqueue_job(db, filename, filepath, metadata, content_sha256=None):
+    job_id = str(uuid.uuid4())
+    page_count = count_pdf_pages(filepath) if os.path.exists(filepath) else None
+    priority, queue_key, queue_vtime = assign_queue_tag(metadata, page_count)
+    db.add(Job(
+        job_id=job_id,
+        filename=filename,
+        filepath=filepath,
+        status="queued",
+        created_at=datetime.now(),
+        job_metadata=json.dumps(metadata),
+        content_sha256=content_sha256,
+        page_count=page_count,
+        priority=priority,
+        queue_key=queue_key,
+        queue_vtime=queue_vtime
+    ))
+    db.commit()
+    notify_jobs_queued()
+    publish_job_events(db, [job_id])
+    return jsonify({
+        'job_id': job_id,
+        'message': 'PDF uploaded successfully! Added to processing queue.',
+        'status': 'queued',
+        'metadata': metadata
+    })
 
-        data = [{"id": c.chapter_id, "name": c.chapter_name} for c in chapters]
-        return jsonify(data)
-    finally:
-        db.close()
+
+# ================================
+# Content-addressed PDF storage
+# ================================
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+def stream_to_file(read, out, digest, limit=None):
+    """Copy read(STREAM_BLOCK_SIZE) blocks into out while hashing them.
+
+    Stops once more than `limit` bytes were seen; returns the number of bytes read.
+    """
+    written = 0
+    while limit is None or written <= limit:
+        block = read(STREAM_BLOCK_SIZE)
+        if not block:
+            break
+        written += len(block)
+        digest.update(block)
+        out.write(block)
+    return written
+
+
+def new_upload_tmp_path():
+    return os.path.join(app.config['UPLOAD_FOLDER'], f".{uuid.uuid4().hex}.tmp")
+
+
+def find_reusable_job(db, content_sha256):
+    """Latest job for the same PDF that is done or still on its way (errored jobs may be retried)"""
+    return (
+        db.query(Job)
+        .filter(Job.content_sha256 == content_sha256, Job.status != "error")
+        .order_by(Job.created_at.desc())
+        .first()
+    )
+
+
+def reused_job_response(job, metadata):
+    """Link an upload to the existing job for its PDF; the job keeps its own metadata"""
+    response = {
+        'job_id': job.job_id,
+        'message': 'This PDF was already uploaded. Linked to the existing job instead of processing it again.',
+        'status': job.status,
+        'duplicate_of': job.job_id,
+        'questions_count': job.questions_count,
+        'metadata': parse_metadata(job.job_metadata)
+    }
+    if metadata and metadata != response['metadata']:
+        response['ignored_metadata'] = metadata
+        response['message'] += ' The details sent with this upload were not applied; the existing job keeps its own.'
+    return jsonify(response)
+
+
+def enqueue_or_reuse(db, original_filename, tmp_path, content_sha256, metadata):
+    """Queue a fully written upload, unless the same PDF already has a job to link to"""
+    existing = find_reusable_job(db, content_sha256)
+    if existing:
+        os.remove(tmp_path)
+        return reused_job_response(existing, metadata)
+
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{content_sha256}.pdf")
+    if os.path.exists(filepath):
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, filepath)
+    try:
+        return enqueue_job(db, timestamped_filename(original_filename), filepath, metadata, content_sha256)
+    except IntegrityError:
+        # A concurrent upload of the same PDF queued its job first (ux_jobs_active_content_sha256)
+        db.rollback()
+        existing = find_reusable_job(db, content_sha256)
+        if not existing:
+            raise
+        return reused_job_response(existing, metadata)
 
 
 @app.route('/upload', methods=['POST'])
@@ -214,67 +734,206 @@ def upload_file():
         return jsonify({'error': 'No file selected'}), 400
 
     if file and allowed_file(file.filename):
+        tmp_path = new_upload_tmp_path()
+        digest = hashlib.sha256()
+        with open(tmp_path, 'wb') as out:
+            stream_to_file(file.stream.read, out, digest)
+
         db = SessionLocal()
         try:
-            job_id = str(uuid.uuid4())
-            filename = secure_filename(file.filename)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{timestamp}_{filename}"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-
-            # Extract metadata from form
-            metadata = {}
-            metadata_fields = [
-                'question_category', 'marks', 'subject_master_subject_id', 'chapter_master_chapter_id',
-                'standard_master_standard_id', 'question_level_question_level_id', 'entrance_exam_master_entrance_exam_id',
-                'pattern_master_pattern_id', 'question_type_question_type_id', 'year_of_appearance_year_of_appearance_id',
-                'topic_master_topic_id', 'sub_topic_master_sub_topic_id', 'user_id', 'asked_status',
-                'asked', 'status'
-            ]
-            
-            for field in metadata_fields:
-                value = request.form.get(field)
-                if value:
-                    # Convert numeric fields
-                    if field in ['marks', 'subject_master_subject_id', 'chapter_master_chapter_id', 
-                               'standard_master_standard_id', 'question_level_question_level_id',
-                               'entrance_exam_master_entrance_exam_id', 'pattern_master_pattern_id',
-                               'question_type_question_type_id', 'year_of_appearance_year_of_appearance_id',
-                               'topic_master_topic_id', 'sub_topic_master_sub_topic_id', 'user_id']:
-                        try:
-                            metadata[field] = int(value)
-                        except ValueError:
-                            metadata[field] = None
-                    else:
-                        metadata[field] = value
-
-            job = Job(
-                job_id=job_id,
-                filename=filename,
-                filepath=filepath,
-                status="queued",
-                created_at=datetime.now()
-            )
-            db.add(job)
-            db.commit()
-
-            # Store metadata in job_metadata field (as JSON)
-            job.job_metadata = json.dumps(metadata)
-            db.commit()
-
-            return jsonify({
-                'job_id': job_id,
-                'message': 'PDF uploaded successfully! Added to processing queue.',
-                'status': 'queued',
-                'metadata': metadata
-            })
+            return enqueue_or_reuse(db, file.filename, tmp_path, digest.hexdigest(), metadata_from_form(request.form))
         finally:
             db.close()
     else:
         return jsonify({'error': 'Invalid file type. Please upload a PDF file.'}), 400
 
 
+# ================================
+# Chunked / resumable uploads
+# ================================
+# 1. POST   /upload/sessions                     filename, size, [sha256], metadata fields
+#                                               (a known sha256 links to the existing job right away)
+# 2. PUT    /upload/sessions/<id>/chunks/<index> raw chunk bytes, optional X-Chunk-SHA256 header
+# 3. GET    /upload/sessions/<id>                which chunks arrived (to resume after a failure)
+# 4. POST   /upload/sessions/<id>/complete       [sha256] -> assembles the PDF and queues the job
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # must stay below MAX_CONTENT_LENGTH
+MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 1024 * 1024 * 1024))
+UPLOAD_SESSION_TTL = timedelta(hours=24)
+UPLOAD_SESSIONS_DIR = os.path.join(app.config['UPLOAD_FOLDER'], '.sessions')
+
+
+def session_dir(upload_id):
+    return os.path.join(UPLOAD_SESSIONS_DIR, upload_id)
+
+
+def chunk_path(upload_id, index):
+    return os.path.join(session_dir(upload_id), f"{index:06d}.part")
+
+
+def total_chunks(session):
+    return -(-session.size // session.chunk_size)
+
+
+def received_chunks(upload_id):
+    try:
+        names = os.listdir(session_dir(upload_id))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-5]) for name in names if name.endswith('.part'))
+
+
+def discard_upload_session(db, session):
+    shutil.rmtree(session_dir(session.upload_id), ignore_errors=True)
+    db.delete(session)
+    db.commit()
+
+
+def upload_session_status(session):
+    received = received_chunks(session.upload_id)
+    return {
+        'upload_id': session.upload_id,
+        'filename': session.filename,
+        'size': session.size,
+        'chunk_size': session.chunk_size,
+        'total_chunks': total_chunks(session),
+        'received_chunks': received,
+        'missing_chunks': sorted(set(range(total_chunks(session))) - set(received))
+    }
+
+
+@app.route('/upload/sessions', methods=['POST'])
+def create_upload_session():
+    fields = request.get_json(silent=True) or request.form
+    filename = fields.get('filename') or ''
+    try:
+        size = int(fields.get('size') or 0)
+    except ValueError:
+        size = 0
+
+    if not allowed_file(filename):
+        return jsonify({'error': 'Invalid file type. Please upload a PDF file.'}), 400
+    if size <= 0 or size > MAX_UPLOAD_SIZE:
+        return jsonify({'error': f'File size must be between 1 byte and {MAX_UPLOAD_SIZE} bytes'}), 400
+
+    db = SessionLocal()
+    try:
+        sha256 = (fields.get('sha256') or '').lower() or None
+        existing = find_reusable_job(db, sha256) if sha256 else None
+        if existing:
+            return reused_job_response(existing, metadata_from_form(fields))
+
+        # Drop abandoned sessions so their chunks don't pile up on disk
+        for stale in db.query(UploadSession).filter(UploadSession.created_at < datetime.now() - UPLOAD_SESSION_TTL).all():
+            discard_upload_session(db, stale)
+
+        session = UploadSession(
+            upload_id=str(uuid.uuid4()),
+            filename=secure_filename(filename),
+            size=size,
+            chunk_size=UPLOAD_CHUNK_SIZE,
+            sha256=sha256,
+            upload_metadata=json.dumps(metadata_from_form(fields)),
+            created_at=datetime.now()
+        )
+        db.add(session)
+        db.commit()
+        os.makedirs(session_dir(session.upload_id), exist_ok=True)
+        return jsonify(upload_session_status(session)), 201
+    finally:
+        db.close()
+
+
+@app.route('/upload/sessions/<upload_id>', methods=['GET'])
+def get_upload_session(upload_id):
+    db = SessionLocal()
+    try:
+        session = db.get(UploadSession, upload_id)
+        if not session:
+            return jsonify({'error': 'Upload session not found'}), 404
+        return jsonify(upload_session_status(session))
+    finally:
+        db.close()
+
+
+@app.route('/upload/sessions/<upload_id>', methods=['DELETE'])
+def abort_upload_session(upload_id):
+    db = SessionLocal()
+    try:
+        session = db.get(UploadSession, upload_id)
+        if not session:
+            return jsonify({'error': 'Upload session not found'}), 404
+        discard_upload_session(db, session)
+        return jsonify({'message': 'Upload cancelled'})
+    finally:
+        db.close()
+
+
+@app.route('/upload/sessions/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def upload_chunk(upload_id, index):
+    """Stream one chunk to disk. Re-sending a chunk simply replaces it, so retries are safe."""
+    db = SessionLocal()
+    try:
+        session = db.get(UploadSession, upload_id)
+        if not session:
+            return jsonify({'error': 'Upload session not found'}), 404
+        if index < 0 or index >= total_chunks(session):
+            return jsonify({'error': 'Chunk index out of range'}), 400
+        expected = min(session.chunk_size, session.size - index * session.chunk_size)
+    finally:
+        db.close()
+
+    path = chunk_path(upload_id, index)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    digest = hashlib.sha256()
+    with open(tmp_path, 'wb') as out:
+        written = stream_to_file(request.stream.read, out, digest, limit=expected)
+
+    checksum = request.headers.get('X-Chunk-SHA256')
+    if written != expected:
+        os.remove(tmp_path)
+        return jsonify({'error': f'Chunk {index} must be {expected} bytes'}), 400
+    if checksum and checksum.lower() != digest.hexdigest():
+        os.remove(tmp_path)
+        return jsonify({'error': f'Checksum mismatch for chunk {index}'}), 400
+
+    os.replace(tmp_path, path)
+    return jsonify({'index': index, 'size': written, 'sha256': digest.hexdigest()})
+
+
+@app.route('/upload/sessions/<upload_id>/complete', methods=['POST'])
+def complete_upload_session(upload_id):
+    """Assemble the chunks into the final PDF, verify its SHA-256 and queue the job"""
+    fields = request.get_json(silent=True) or request.form
+    db = SessionLocal()
+    try:
+        session = db.get(UploadSession, upload_id)
+        if not session:
+            return jsonify({'error': 'Upload session not found'}), 404
+
+        missing = upload_session_status(session)['missing_chunks']
+        if missing:
+            return jsonify({'error': 'Upload incomplete', 'missing_chunks': missing}), 409
+
+        tmp_path = new_upload_tmp_path()
+        digest = hashlib.sha256()
+        with open(tmp_path, 'wb') as out:
+            for index in range(total_chunks(session)):
+                with open(chunk_path(upload_id, index), 'rb') as part:
+                    stream_to_file(part.read, out, digest)
+
+        expected = (fields.get('sha256') or session.sha256 or '').lower()
+        original_filename = session.filename
+        metadata = json.loads(session.upload_metadata or '{}')
+        discard_upload_session(db, session)
+        if expected and expected != digest.hexdigest():
+            os.remove(tmp_path)
+            return jsonify({'error': 'Checksum mismatch, please upload the file again'}), 400
+
+        return enqueue_or_reuse(db, original_filename, tmp_path, digest.hexdigest(), metadata)
+    finally:
+        db.close()
+
+
 @app.route('/status/<job_id>')
 def get_status(job_id):
     db = SessionLocal()
@@ -292,28 +951,497 @@ def get_status(job_id):
             'completed_at': job.completed_at.isoformat() if job.completed_at else None,
             'error_message': job.error_message,
             'questions_count': job.questions_count,
-            'pc_processor': job.pc_processor
+            'pc_processor': job.pc_processor,
+            'attempts': job.attempts or 0,
+            'lease_expires_at': job.lease_expires_at.isoformat() if job.lease_expires_at else None,
+            'page_count': job.page_count,
+            'mmd_url': url_for('get_job_mmd', job_id=job.job_id) if has_mmd(job) else None,
+            'ingest': ingest_status(db, job.job_id),
+            'shards': {
+                'total': job.shard_count,
+                'completed': db.query(JobShard).filter(JobShard.job_id == job.job_id, JobShard.status == "completed").count()
+            } if job.shard_count else None
         })
     finally:
         db.close()
 
 
+# ================================
+# Queue listing (projected, keyset-paginated)
+# ================================
+QUEUE_PAGE_SIZE = 50
+MAX_QUEUE_CHANGES = 500
+
+# Only what the queue page shows; never mmd_content/job_metadata
+QUEUE_COLUMNS = (
+    Job.job_id, Job.filename, Job.status, Job.created_at, Job.processed_at, Job.completed_at,
+    Job.error_message, Job.questions_count, Job.pc_processor, Job.updated_at
+)
+
+
+def list_queue(db, cursor=None, limit=QUEUE_PAGE_SIZE):
+    """One page of jobs, newest first. Returns (rows, next_cursor or None)."""
+    query = select(*QUEUE_COLUMNS)
+    if cursor:
+        created_at, job_id = decode_cursor(cursor, cast=str)
+        query = query.where(or_(
+            Job.created_at < created_at,
+            and_(Job.created_at == created_at, Job.job_id < job_id)
+        ))
+    rows = db.execute(query.order_by(Job.created_at.desc(), Job.job_id.desc()).limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].job_id)
+    return rows, next_cursor
+
+
+def change_token(updated_at, job_id=''):
+    """?since= token: the (updated_at, job_id) of the last change seen. Fixed-width timestamp,
+    so tokens also compare correctly as plain strings (the queue page relies on it)."""
+    return f"{updated_at.isoformat(timespec='microseconds')}|{job_id}"
+
+
+def parse_change_token(token):
+    """(updated_at, job_id); a bare timestamp (older pages) means every job changed after it"""
+    updated_at, _, job_id = token.partition("|")
+    return datetime.fromisoformat(updated_at), job_id
+
+
+def queue_changes(db, since):
+    """Up to MAX_QUEUE_CHANGES jobs changed after the `since` token, in (updated_at, job_id) order"""
+    updated_at, job_id = parse_change_token(since)
+    return db.execute(
+        select(*QUEUE_COLUMNS)
+        .where(or_(Job.updated_at > updated_at, and_(Job.updated_at == updated_at, Job.job_id > job_id)))
+        .order_by(Job.updated_at.asc(), Job.job_id.asc())
+        .limit(MAX_QUEUE_CHANGES)
+    ).all()
+
+
+def job_status_counts(db):
+    return dict(db.execute(select(Job.status, func.count()).group_by(Job.status)).all())
+
+
+def queue_row_to_dict(row):
+    data = dict(row._mapping)
+    data['since'] = change_token(row.updated_at, row.job_id) if row.updated_at else None
+    for key in ('created_at', 'processed_at', 'completed_at', 'updated_at'):
+        data[key] = data[key].isoformat() if data[key] else None
+    return data
+
+
 @app.route('/queue')
 def view_queue():
+    cursor = request.args.get('cursor')
     db = SessionLocal()
     try:
-        jobs = db.query(Job).order_by(Job.created_at.desc()).all()
-        return render_template('queue.html', jobs=jobs)
+        since, last_event_id = datetime.now(), job_event_seq
+        try:
+            jobs, next_cursor = list_queue(db, cursor)
+        except ValueError:
+            jobs, next_cursor = list_queue(db)
+            cursor = None
+        return render_template('queue.html', jobs=jobs, counts=job_status_counts(db),
+                               cursor=cursor, next_cursor=next_cursor, since=change_token(since),
+                               last_event_id=last_event_id)
     finally:
         db.close()
 
 
+@app.route('/api/queue', methods=['GET'])
+def api_queue():
+    """Queue as JSON. ?cursor=&limit= pages newest first; ?since=<token> returns only jobs
+    changed since then. Every response carries the `since` token to poll with next."""
+    db = SessionLocal()
+    try:
+        counts = job_status_counts(db)
+        if request.args.get('since'):
+            since = request.args['since']
+            try:
+                rows = queue_changes(db, since)
+            except ValueError:
+                return jsonify({'error': 'Invalid since'}), 400
+            return jsonify({
+                'jobs': [queue_row_to_dict(r) for r in rows],
+                'counts': counts,
+                'since': change_token(rows[-1].updated_at, rows[-1].job_id) if rows else since,
+                'has_more': len(rows) == MAX_QUEUE_CHANGES  # call again with the new since
+            })
+
+        since = datetime.now()
+        limit = max(1, min(request.args.get('limit', QUEUE_PAGE_SIZE, type=int), MAX_QUEUE_CHANGES))
+        try:
+            rows, next_cursor = list_queue(db, request.args.get('cursor'), limit)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({
+            'jobs': [queue_row_to_dict(r) for r in rows],
+            'counts': counts,
+            'next_cursor': next_cursor,
+            'since': change_token(since)
+        })
+    finally:
+        db.close()
+
+
+# ================================
+# Job event bus (server-sent events)
+# ================================
+# Status transitions are published once, by the request that made them, into a bounded
+# in-memory history; /api/events streams that history to any number of browsers/scripts
+# without them querying the database. Event ids are sequence numbers, so a reconnecting
+# EventSource resumes from Last-Event-ID.
+EVENT_HISTORY_SIZE = 1000
+SSE_KEEPALIVE_SECONDS = 15
+
+job_events = deque(maxlen=EVENT_HISTORY_SIZE)  # (seq, kind, data)
+job_events_changed = threading.Condition()
+job_event_seq = 0
+
+
+def publish_event(kind, data):
+    global job_event_seq
+    with job_events_changed:
+        job_event_seq += 1
+        job_events.append((job_event_seq, kind, data))
+        job_events_changed.notify_all()
+
+
+def publish_job_events(db, job_ids):
+    """Publish the current queue row of each job, then the new status counts"""
+    job_ids = list(job_ids)
+    if not job_ids:
+        return
+    for row in db.execute(select(*QUEUE_COLUMNS).where(Job.job_id.in_(job_ids))).all():
+        publish_event("job", queue_row_to_dict(row))
+    publish_event("counts", job_status_counts(db))
+
+
+def format_sse(seq, kind, data):
+    return f"id: {seq}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """Server-sent events: `job` (a queue row whose status changed), `counts` (status totals)
+    and `resync` (events were missed; refetch /api/queue). ?job_id= follows a single job."""
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('last_event_id', job_event_seq, type=int)
+    job_id = request.args.get('job_id')
+
+    def generate(seq):
+        yield "retry: 3000\n\n"
+        while True:
+            with job_events_changed:
+                job_events_changed.wait_for(lambda: job_event_seq > seq, timeout=SSE_KEEPALIVE_SECONDS)
+                pending = [e for e in job_events if e[0] > seq]
+            if not pending:
+                yield ": keepalive\n\n"
+                continue
+            if pending[0][0] > seq + 1:
+                yield format_sse(pending[0][0] - 1, "resync", {})
+            for event_seq, kind, data in pending:
+                seq = event_seq
+                if job_id and (kind != "job" or data["job_id"] != job_id):
+                    continue
+                yield format_sse(event_seq, kind, data)
+
+    return Response(generate(last_id), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# ================================
+# MMD storage (gzip files, loaded on demand)
+# ================================
+# The Nougat markdown of a job can run to megabytes, so it is kept out of the jobs row:
+# each job's MMD is one gzip file under MMD_FOLDER (outside the public /uploads route)
+# and is only read by /api/jobs/<job_id>/mmd.
+MMD_FOLDER = os.path.abspath(os.getenv('MMD_FOLDER', 'mmd'))  # send_file resolves relative paths against app.root_path, not the cwd
+MMD_MIMETYPE = "text/markdown"  # Werkzeug appends "; charset=utf-8" to text/* types
+os.makedirs(MMD_FOLDER, exist_ok=True)
+
+
+def mmd_path(job_id):
+    return os.path.join(MMD_FOLDER, f"{secure_filename(job_id)}.mmd.gz")
+
+
+def store_mmd(job_id, content):
+    """Write (or replace) a job's MMD atomically"""
+    path = mmd_path(job_id)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with gzip.open(tmp_path, "wb", compresslevel=6) as out:
+        out.write((content or '').encode("utf-8"))
+    os.replace(tmp_path, path)
+
+
+def store_mmd_file(job_id, gzip_path):
+    """Store an already gzipped MMD (e.g. a spooled upload) as the job's MMD"""
+    path = mmd_path(job_id)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    shutil.copyfile(gzip_path, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def store_mmd_parts(job_id, gzip_paths, separator="\n\n"):
+    """Store the concatenation of several gzipped MMD files (e.g. a sharded job's) as the job's MMD"""
+    path = mmd_path(job_id)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with gzip.open(tmp_path, "wb", compresslevel=6) as out:
+        for n, part in enumerate(gzip_paths):
+            if n:
+                out.write(separator.encode("utf-8"))
+            if os.path.exists(part):
+                with gzip.open(part, "rb") as f:
+                    shutil.copyfileobj(f, out, STREAM_BLOCK_SIZE)
+    os.replace(tmp_path, path)
+
+
+def has_mmd(job):
+    return bool(job.mmd_content) or os.path.exists(mmd_path(job.job_id))
+
+
+def mmd_size(path):
+    """Uncompressed size, read from the gzip trailer (ISIZE) without decompressing"""
+    with open(path, "rb") as f:
+        f.seek(-4, os.SEEK_END)
+        return int.from_bytes(f.read(4), "little")
+
+
+def stream_mmd(path, start=0, length=None):
+    with gzip.open(path, "rb") as f:
+        f.seek(start)
+        while length is None or length > 0:
+            block = f.read(STREAM_BLOCK_SIZE if length is None else min(STREAM_BLOCK_SIZE, length))
+            if not block:
+                break
+            if length is not None:
+                length -= len(block)
+            yield block
+
+
+def move_inline_mmd_to_files(batch_size=100):
+    """Move MMD stored inline by older versions out of the jobs table"""
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(Job.job_id, Job.mmd_content).where(Job.mmd_content.is_not(None)).limit(batch_size)
+            ).all()
+            if not rows:
+                return
+            for r in rows:
+                if r.mmd_content:
+                    store_mmd(r.job_id, r.mmd_content)
+            conn.execute(
+                update(Job.__table__).where(Job.job_id.in_([r.job_id for r in rows])).values(mmd_content=None)
+            )
+
+
+move_inline_mmd_to_files()
+
+
+@app.route('/api/jobs/<job_id>/mmd', methods=['GET'])
+def get_job_mmd(job_id):
+    """A job's MMD, streamed. Supports byte Range requests over the markdown text; clients
+    that accept gzip and want the whole document get the stored file as-is."""
+    path = mmd_path(job_id)
+    if not os.path.exists(path):
+        db = SessionLocal()
+        try:
+            job = db.get(Job, job_id)
+            if not job:
+                return jsonify({'error': 'Job not found'}), 404
+            if not job.mmd_content:
+                return jsonify({'error': 'No MMD for this job'}), 404
+            return Response(job.mmd_content, mimetype=MMD_MIMETYPE)
+        finally:
+            db.close()
+
+    if request.range is None and 'gzip' in request.accept_encodings:
+        response = send_file(path, mimetype=MMD_MIMETYPE, conditional=True)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Accept-Ranges'] = 'none'  # Range offsets are into the decoded text, not these bytes
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    size = mmd_size(path)
+    if request.range is None or len(request.range.ranges) != 1:  # multipart ranges get the whole document
+        response = Response(stream_mmd(path), mimetype=MMD_MIMETYPE)
+        response.content_length = size
+    else:
+        byte_range = request.range.range_for_length(size)
+        if byte_range is None:
+            response = Response(status=416)
+            response.headers['Content-Range'] = f"bytes */{size}"
+            return response
+        start, stop = byte_range
+        response = Response(stream_mmd(path, start, stop - start), status=206, mimetype=MMD_MIMETYPE)
+        response.content_length = stop - start
+        response.headers['Content-Range'] = f"bytes {start}-{stop - 1}/{size}"
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+# ================================
+# Questions listing (keyset pagination)
+# ================================
+QUESTIONS_PAGE_SIZE = 50
+MAX_QUESTIONS_PAGE_SIZE = 200
+
+# query arg -> (column, type)
+QUESTION_FILTERS = {
+    'status': (Question.status, str),
+    'category': (Question.question_category, str),
+    'subject': (Question.subject_master_subject_id, int),
+    'chapter': (Question.chapter_master_chapter_id, int),
+}
+
+
+def encode_cursor(created_at, row_id):
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor, cast=int):
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), cast(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def question_filters_from_args(args):
+    filters = {}
+    for name, (_, cast) in QUESTION_FILTERS.items():
+        value = args.get(name, type=cast)
+        if value not in (None, ''):
+            filters[name] = value
+    return filters
+
+
+def list_questions(db, filters, cursor=None, limit=QUESTIONS_PAGE_SIZE):
+    """One page of questions, newest first. Returns (questions, next_cursor or None)."""
+    query = db.query(Question)
+    for name, value in filters.items():
+        query = query.filter(QUESTION_FILTERS[name][0] == value)
+    if cursor:
+        created_at, question_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Question.created_at < created_at,
+            and_(Question.created_at == created_at, Question.question_id < question_id)
+        ))
+    rows = query.order_by(Question.created_at.desc(), Question.question_id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].question_id)
+    return rows, next_cursor
+
+
+def question_to_dict(q):
+    data = {c.name: getattr(q, c.name) for c in Question.__table__.columns if c.name != 'content_hash'}
+    for key in ('created_at', 'date'):
+        data[key] = data[key].isoformat() if data[key] else None
+    return data
+
+
+questions_fts = table("questions_fts", column("rowid"), column("rank"))
+
+
+def fts5_query(search):
+    """Quote every term so user input can't trip FTS5 syntax; the last term also matches as a prefix"""
+    terms = ['"' + t.replace('"', '""') + '"' for t in search.split()]
+    return " ".join(terms) + "*" if terms else None
+
+
+def search_questions(db, search, filters, offset=0, limit=QUESTIONS_PAGE_SIZE):
+    """Full-text search over SEARCH_COLUMNS, best match first. Returns (questions, has_more)."""
+    query = db.query(Question)
+    if SEARCH_BACKEND == "fts5":
+        match = fts5_query(search)
+        if not match:
+            return [], False
+        query = (
+            query.join(questions_fts, questions_fts.c.rowid == Question.question_id)
+            .filter(text("questions_fts MATCH :match")).params(match=match)
+            .order_by(questions_fts.c.rank)
+        )
+    elif SEARCH_BACKEND == "mysql":
+        relevance = mysql_match(*(Question.__table__.c[c] for c in SEARCH_COLUMNS), against=search)
+        query = query.filter(relevance.in_natural_language_mode()).order_by(relevance.in_natural_language_mode().desc())
+    else:
+        pattern = f"%{search}%"
+        query = query.filter(or_(*(Question.__table__.c[c].ilike(pattern) for c in SEARCH_COLUMNS)))
+        query = query.order_by(Question.created_at.desc(), Question.question_id.desc())
+
+    for name, value in filters.items():
+        query = query.filter(QUESTION_FILTERS[name][0] == value)
+    rows = query.offset(offset).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+
 @app.route('/questions')
 def questions():
+    filters = question_filters_from_args(request.args)
+    search = request.args.get('q', '').strip()
+    cursor = request.args.get('cursor')
+    db = SessionLocal()
+    try:
+        if search:
+            # Search results are ranked, so page by offset; the cursor is just the offset here
+            offset = int(cursor) if cursor and cursor.isdigit() else 0
+            qs, has_more = search_questions(db, search, filters, offset)
+            next_cursor = str(offset + len(qs)) if has_more else None
+        else:
+            try:
+                qs, next_cursor = list_questions(db, filters, cursor)
+            except ValueError:
+                qs, next_cursor = list_questions(db, filters)
+                cursor = None
+        return render_template('questions.html', questions=qs, filters=filters, search=search,
+                               cursor=cursor, next_cursor=next_cursor)
+    finally:
+        db.close()
+
+
+@app.route('/api/questions', methods=['GET'])
+def api_questions():
+    """JSON variant of /questions: ?status=&category=&subject=&chapter=&limit=&cursor="""
+    filters = question_filters_from_args(request.args)
+    limit = max(1, min(request.args.get('limit', QUESTIONS_PAGE_SIZE, type=int), MAX_QUESTIONS_PAGE_SIZE))
+    db = SessionLocal()
+    try:
+        try:
+            qs, next_cursor = list_questions(db, filters, request.args.get('cursor'), limit)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({
+            'questions': [question_to_dict(q) for q in qs],
+            'next_cursor': next_cursor
+        })
+    finally:
+        db.close()
+
+
+@app.route('/api/questions/search', methods=['GET'])
+def api_search_questions():
+    """Ranked full-text search: ?q=&status=&category=&subject=&chapter=&limit=&offset="""
+    search = request.args.get('q', '').strip()
+    if not search:
+        return jsonify({'error': 'Search query (q) required'}), 400
+    filters = question_filters_from_args(request.args)
+    limit = max(1, min(request.args.get('limit', QUESTIONS_PAGE_SIZE, type=int), MAX_QUESTIONS_PAGE_SIZE))
+    offset = max(0, request.args.get('offset', 0, type=int))
     db = SessionLocal()
     try:
-        qs = db.query(Question).order_by(Question.created_at.desc()).all()
-        return render_template('questions.html', questions=qs)
+        qs, has_more = search_questions(db, search, filters, offset, limit)
+        return jsonify({
+            'questions': [question_to_dict(q) for q in qs],
+            'next_offset': offset + len(qs) if has_more else None
+        })
     finally:
         db.close()
 
@@ -321,54 +1449,126 @@ def questions():
 # ================================
 # Masters read-only API (local SQLite)
 # ================================
-@app.route('/api/masters', methods=['GET'])
-def get_masters():
+# Master tables almost never change, so the assembled payloads are cached in-process
+# (with an ETag, so browsers revalidate with a cheap 304) until the TTL runs out or
+# invalidate_masters_cache() is called.
+MASTERS_CACHE_TTL = int(os.getenv('MASTERS_CACHE_TTL', 10 * 60))
+
+masters_cache = {}  # source -> (expires_at, body, etag)
+masters_cache_lock = threading.Lock()
+masters_cache_generation = 0  # bumped by every invalidation; a rebuild that straddles one is not stored
+
+
+# subject_id -> chapters sorted by name, built from chapter_master in one query
+chapters_by_subject = None
+
+
+def invalidate_masters_cache():
+    global chapters_by_subject, masters_cache_generation
+    with masters_cache_lock:
+        masters_cache.clear()
+        chapters_by_subject = None
+        masters_cache_generation += 1
+
+
+def group_chapters_by_subject(rows):
+    """rows of (subject_id, chapter_id, chapter_name), already ordered by name"""
+    grouped = {}
+    for subject_id, chapter_id, chapter_name in rows:
+        if subject_id is None:
+            continue
+        grouped.setdefault(subject_id, []).append({"id": chapter_id, "name": chapter_name})
+    return grouped
+
+
+def chapters_by_subject_map():
+    global chapters_by_subject
+    with masters_cache_lock:
+        grouped, generation = chapters_by_subject, masters_cache_generation
+    if grouped is None:
+        db = SessionLocal()
+        try:
+            grouped = group_chapters_by_subject(db.query(
+                ChapterMaster.subject_master_subject_id, ChapterMaster.chapter_id, ChapterMaster.chapter_name
+            ).order_by(ChapterMaster.chapter_name.asc()).all())
+        finally:
+            db.close()
+        with masters_cache_lock:
+            if generation == masters_cache_generation:
+                chapters_by_subject = grouped
+    return grouped
+
+
+def cached_masters_response(source, build):
+    """Serve the masters payload for `source` from cache, building it with build() on a miss"""
+    with masters_cache_lock:
+        entry, generation = masters_cache.get(source), masters_cache_generation
+    if not entry or entry[0] <= time.monotonic():
+        body = app.json.dumps(build()).encode("utf-8")
+        entry = (time.monotonic() + MASTERS_CACHE_TTL, body, hashlib.sha1(body).hexdigest())
+        with masters_cache_lock:
+            if generation == masters_cache_generation:
+                masters_cache[source] = entry
+
+    _, body, etag = entry
+    response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"  # always revalidate; unchanged data costs a 304
+    return response.make_conditional(request)
+
+
+def build_local_masters():
     db = SessionLocal()
     try:
-        def rows_to_list(rows, id_attr, name_attr):
-            return [{"id": getattr(r, id_attr), "name": getattr(r, name_attr)} for r in rows]
-
-        data = {
-            "subjects": rows_to_list(db.query(SubjectMaster).order_by(SubjectMaster.subject_name.asc()).all(), "subject_id", "subject_name"),
-            "chapters": rows_to_list(db.query(ChapterMaster).order_by(ChapterMaster.chapter_name.asc()).all(), "chapter_id", "chapter_name"),
-            "standards": rows_to_list(db.query(StandardMaster).order_by(StandardMaster.standard_name.asc()).all(), "standard_id", "standard_name"),
-            "levels": rows_to_list(db.query(QuestionLevelMaster).order_by(QuestionLevelMaster.level_name.asc()).all(), "question_level_id", "level_name"),
-            "exams": rows_to_list(db.query(EntranceExamMaster).order_by(EntranceExamMaster.exam_name.asc()).all(), "entrance_exam_id", "exam_name"),
-            "patterns": rows_to_list(db.query(PatternMaster).order_by(PatternMaster.pattern_name.asc()).all(), "pattern_id", "pattern_name"),
-            "types": rows_to_list(db.query(QuestionTypeMaster).order_by(QuestionTypeMaster.type_name.asc()).all(), "question_type_id", "type_name"),
-            "years": rows_to_list(db.query(YearOfAppearanceMaster).order_by(YearOfAppearanceMaster.year.asc()).all(), "year_of_appearance_id", "year"),
-            "topics": rows_to_list(db.query(TopicMaster).order_by(TopicMaster.topic_name.asc()).all(), "topic_id", "topic_name"),
-            "sub_topics": rows_to_list(db.query(SubTopicMaster).order_by(SubTopicMaster.sub_topic_name.asc()).all(), "sub_topic_id", "sub_topic_name"),
+        def fetch(id_col, name_col):
+            rows = db.query(id_col, name_col).order_by(name_col.asc()).all()
+            return [{"id": r[0], "name": r[1]} for r in rows]
+
+        return {
+            "subjects": fetch(SubjectMaster.subject_id, SubjectMaster.subject_name),
+            "chapters": fetch(ChapterMaster.chapter_id, ChapterMaster.chapter_name),
+            "standards": fetch(StandardMaster.standard_id, StandardMaster.standard_name),
+            "levels": fetch(QuestionLevelMaster.question_level_id, QuestionLevelMaster.level_name),
+            "exams": fetch(EntranceExamMaster.entrance_exam_id, EntranceExamMaster.exam_name),
+            "patterns": fetch(PatternMaster.pattern_id, PatternMaster.pattern_name),
+            "types": fetch(QuestionTypeMaster.question_type_id, QuestionTypeMaster.type_name),
+            "years": fetch(YearOfAppearanceMaster.year_of_appearance_id, YearOfAppearanceMaster.year),
+            "topics": fetch(TopicMaster.topic_id, TopicMaster.topic_name),
+            "sub_topics": fetch(SubTopicMaster.sub_topic_id, SubTopicMaster.sub_topic_name),
+            # Only id/name are selected, so older user_master tables without 'email' work too
+            "users": fetch(UserMaster.user_id, UserMaster.username),
         }
-        # Users: some SQLite schemas may not have the optional 'email' column; fall back to raw SELECT
-        try:
-            data["users"] = rows_to_list(db.query(UserMaster).order_by(UserMaster.username.asc()).all(), "user_id", "username")
-        except Exception:
-            with engine.connect() as conn:
-                result = conn.exec_driver_sql("SELECT user_id AS id, username AS name FROM user_master ORDER BY username ASC")
-                data["users"] = [dict(row) for row in result.mappings().all()]
-        return jsonify(data)
     finally:
         db.close()
 
 
+@app.route('/api/masters', methods=['GET'])
+def get_masters():
+    return cached_masters_response("local", build_local_masters)
+
+
+chapters_by_subject_map()  # build at startup so the first dropdown change is served from memory
+
+
+@app.route('/api/masters/invalidate', methods=['POST'])
+def invalidate_masters():
+    """Drop cached master payloads after the master tables were edited"""
+    invalidate_masters_cache()
+    return jsonify({'message': 'Masters cache cleared'})
+
+
 # ================================
 # Masters read-only API (MySQL - Same credentials as pc_processor.py)
 # ================================
-@app.route('/api/masters_mysql', methods=['GET'])
-def get_masters_mysql():
+def build_mysql_masters():
     """Fetch master data from MySQL database using same credentials as pc_processor.py"""
-    conn = None
-    try:
-        conn = mysql.connector.connect(**MYSQL_CONFIG)
-        cur = conn.cursor(dictionary=True)
-
+    with mysql_engine.connect() as conn:
         def fetch(table, id_col, name_col):
             """Fetch data from a master table"""
-            cur.execute(f"SELECT {id_col} AS id, {name_col} AS name FROM {table} ORDER BY {name_col} ASC")
-            return cur.fetchall()
+            result = conn.exec_driver_sql(f"SELECT {id_col} AS id, {name_col} AS name FROM {table} ORDER BY {name_col} ASC")
+            return [dict(row) for row in result.mappings()]
 
-        data = {
+        return {
             "subjects": fetch('subject_master', 'subject_id', 'subject_name'),
             "chapters": fetch('chapter_master', 'chapter_id', 'chapter_name'),
             "standards": fetch('standard_master', 'standard_id', 'standard_name'),
@@ -381,74 +1581,759 @@ def get_masters_mysql():
             "sub_topics": fetch('sub_topic_master', 'sub_topic_id', 'sub_topic_name'),
             "users": fetch('users', 'id', 'username'),
         }
-        return jsonify(data)
+
+
+@app.route('/api/masters_mysql', methods=['GET'])
+def get_masters_mysql():
+    if masters_replica_ready():
+        return get_masters()
+    try:
+        return cached_masters_response("mysql", build_mysql_masters)
     except Exception as e:
         print(f"❌ MySQL connection error: {e}")
         return jsonify({'error': f'Database connection failed: {str(e)}'}), 500
-    finally:
-        if conn:
-            conn.close()
+
+def build_mysql_chapters_by_subject():
+    with mysql_engine.connect() as conn:
+        return group_chapters_by_subject(conn.exec_driver_sql(
+            "SELECT subject_master_subject_id, chapter_id, chapter_name FROM chapter_master ORDER BY chapter_name ASC"
+        ).all())
+
+
+@app.route('/api/chapters_by_subject_mysql', methods=['GET'])
+def get_all_chapters_by_subject_mysql():
+    if masters_replica_ready():
+        return get_all_chapters_by_subject()
+    try:
+        return cached_masters_response("mysql_chapters", build_mysql_chapters_by_subject)
+    except Exception as e:
+        print(f"❌ MySQL chapters query error: {e}")
+        return jsonify({'error': f'Database query failed: {str(e)}'}), 500
+
 
 @app.route('/api/chapters_by_subject_mysql/<int:subject_id>', methods=['GET'])
 def get_chapters_by_subject_mysql(subject_id):
     """Get chapters by subject from MySQL database"""
-    conn = None
+    if masters_replica_ready():
+        return get_chapters_by_subject(subject_id)
     try:
-        conn = mysql.connector.connect(**MYSQL_CONFIG)
-        cur = conn.cursor(dictionary=True)
-        
-        cur.execute("""
-            SELECT chapter_id AS id, chapter_name AS name 
-            FROM chapter_master 
-            WHERE subject_master_subject_id = %s 
-            ORDER BY chapter_name ASC
-        """, (subject_id,))
-        
-        chapters = cur.fetchall()
+        with mysql_engine.connect() as conn:
+            result = conn.execute(text("""
+                SELECT chapter_id AS id, chapter_name AS name
+                FROM chapter_master
+                WHERE subject_master_subject_id = :subject_id
+                ORDER BY chapter_name ASC
+            """), {"subject_id": subject_id})
+            chapters = [dict(row) for row in result.mappings()]
         return jsonify(chapters)
     except Exception as e:
         print(f"❌ MySQL chapters query error: {e}")
         return jsonify({'error': f'Database query failed: {str(e)}'}), 500
-    finally:
-        if conn:
-            conn.close()
+
+
+@app.route('/api/mysql_pool_status', methods=['GET'])
+def mysql_pool_status():
+    """Connection pool stats for the external MySQL, for monitoring"""
+    pool = mysql_engine.pool
+    return jsonify({
+        'pool_size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'checked_in': pool.checkedin(),
+        'overflow': max(0, pool.overflow()),
+        'connections_opened': mysql_pool_counters['connections_opened'],
+        'checkouts': mysql_pool_counters['checkouts']
+    })
+
+
+# ================================
+# MASTERS REPLICA (MySQL -> local SQLite)
+# ================================
+# The MySQL master tables are mirrored into the local master tables on a schedule, and
+# once a copy exists the *_mysql endpoints read it instead of crossing the WAN. Each sync
+# diffs the remote rows against the local ones and writes only what changed.
+# MASTERS_SYNC_INTERVAL=0 turns the replica off (reads go to MySQL live again).
+MASTERS_SYNC_INTERVAL = int(os.getenv('MASTERS_SYNC_INTERVAL', 5 * 60))
+
+# (local model, MySQL table, {local column: MySQL column}, defaults for local-only NOT NULL columns)
+MASTER_REPLICA_TABLES = [
+    (SubjectMaster, 'subject_master', {'subject_id': 'subject_id', 'subject_name': 'subject_name'}, {}),
+    (ChapterMaster, 'chapter_master', {'chapter_id': 'chapter_id', 'chapter_name': 'chapter_name',
+                                       'subject_master_subject_id': 'subject_master_subject_id'}, {}),
+    (StandardMaster, 'standard_master', {'standard_id': 'standard_id', 'standard_name': 'standard_name'}, {}),
+    (QuestionLevelMaster, 'question_level', {'question_level_id': 'question_level_id', 'level_name': 'question_level'}, {}),
+    (EntranceExamMaster, 'entrance_exam_master', {'entrance_exam_id': 'entrance_exam_id', 'exam_name': 'entrance_exam_name'}, {}),
+    (PatternMaster, 'pattern_master', {'pattern_id': 'pattern_id', 'pattern_name': 'pattern_name'}, {}),
+    (QuestionTypeMaster, 'question_type', {'question_type_id': 'question_type_id', 'type_name': 'question_type'}, {}),
+    (YearOfAppearanceMaster, 'year_of_appearance', {'year_of_appearance_id': 'year_of_appearance_id', 'year': 'year_of_appearance'}, {}),
+    (TopicMaster, 'topic_master', {'topic_id': 'topic_id', 'topic_name': 'topic_name'}, {}),
+    (SubTopicMaster, 'sub_topic_master', {'sub_topic_id': 'sub_topic_id', 'sub_topic_name': 'sub_topic_name'}, {}),
+    (UserMaster, 'users', {'user_id': 'id', 'username': 'username'}, {'email': ''}),
+]
+
+masters_sync_state = {"last_synced_at": None, "last_error": None, "last_changes": None, "ready": False}
+masters_sync_lock = threading.Lock()
+
+
+def fetch_master_table(conn, model, source, columns):
+    """{primary key: row} of one MySQL master table, with local column names"""
+    key = model.__mapper__.primary_key[0]
+    select_list = ", ".join(f"{remote} AS {local}" for local, remote in columns.items())
+    return {row[key.name]: dict(row) for row in conn.exec_driver_sql(f"SELECT {select_list} FROM {source}").mappings()}
+
+
+def apply_master_diff(db, model, remote_rows, columns, defaults):
+    """Bring one local master table in line with its fetched MySQL rows. Returns (inserted, updated, deleted)."""
+    key = model.__mapper__.primary_key[0]
+    local_rows = {row[key.name]: dict(row) for row in db.execute(select(*[model.__table__.c[c] for c in columns])).mappings()}
+
+    inserts = [{**defaults, **remote_rows[k]} for k in remote_rows.keys() - local_rows.keys()]
+    updates = [remote_rows[k] for k in remote_rows.keys() & local_rows.keys() if remote_rows[k] != local_rows[k]]
+    deletes = list(local_rows.keys() - remote_rows.keys())
+
+    if inserts:
+        db.execute(insert(model), inserts)
+    if updates:
+        db.execute(update(model), updates)  # bulk UPDATE by primary key
+    if deletes:
+        db.execute(delete(model).where(key.in_(deletes)))
+    return len(inserts), len(updates), len(deletes)
+
+
+def sync_masters_from_mysql():
+    """Mirror every MySQL master table into SQLite; returns per-table change counts.
+
+    Every table is fetched over the WAN first, then all diffs are applied in one short local
+    transaction, so SQLite's write lock is never held across a remote round trip.
+    """
+    with masters_sync_lock:
+        try:
+            with mysql_engine.connect() as conn:
+                fetched = [
+                    (model, fetch_master_table(conn, model, source, columns), columns, defaults)
+                    for model, source, columns, defaults in MASTER_REPLICA_TABLES
+                ]
+        except Exception as e:
+            masters_sync_state["last_error"] = str(e)
+            raise
+
+        db = SessionLocal()
+        try:
+            changes = {}
+            for model, remote_rows, columns, defaults in fetched:
+                inserted, updated, deleted = apply_master_diff(db, model, remote_rows, columns, defaults)
+                if inserted or updated or deleted:
+                    changes[model.__tablename__] = {"inserted": inserted, "updated": updated, "deleted": deleted}
+            synced_at = datetime.now()
+            db.merge(MastersSync(id=1, synced_at=synced_at))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            masters_sync_state["last_error"] = str(e)
+            raise
+        finally:
+            db.close()
+
+        if changes:
+            invalidate_masters_cache()
+        masters_sync_state.update(last_synced_at=synced_at, last_error=None, last_changes=changes, ready=True)
+        return changes
+
+
+def masters_replica_ready():
+    """True once a full MySQL sync has committed (in this run or an earlier one).
+
+    Rows in the local master tables alone don't count: they may be locally created, not a MySQL copy.
+    """
+    if not MASTERS_SYNC_INTERVAL:
+        return False
+    if not masters_sync_state["ready"]:
+        db = SessionLocal()
+        try:
+            marker = db.get(MastersSync, 1)
+        finally:
+            db.close()
+        if marker:
+            masters_sync_state["ready"] = True
+            masters_sync_state["last_synced_at"] = masters_sync_state["last_synced_at"] or marker.synced_at
+    return masters_sync_state["ready"]
+
+
+@app.route('/api/masters/sync', methods=['GET', 'POST'])
+def masters_sync():
+    """GET: replica status. POST: sync from MySQL now instead of waiting for the schedule."""
+    if request.method == 'POST':
+        try:
+            sync_masters_from_mysql()
+        except Exception as e:
+            print(f"❌ Masters sync error: {e}")
+            return jsonify({'error': f'Masters sync failed: {str(e)}'}), 500
+
+    last_synced_at = masters_sync_state["last_synced_at"]
+    return jsonify({
+        'enabled': bool(MASTERS_SYNC_INTERVAL),
+        'interval_seconds': MASTERS_SYNC_INTERVAL,
+        'last_synced_at': last_synced_at.isoformat() if last_synced_at else None,
+        'last_error': masters_sync_state["last_error"],
+        'last_changes': masters_sync_state["last_changes"],
+        'serving_local': masters_replica_ready()
+    })
+
+
+def masters_sync_loop():
+    while True:
+        try:
+            changes = sync_masters_from_mysql()
+            if changes:
+                print(f"🔄 Masters sync: {changes}")
+        except Exception as e:
+            print(f"❌ Masters sync error: {e}")
+        time.sleep(MASTERS_SYNC_INTERVAL)
 
 
 # ================================
 # PC PROCESSOR API ENDPOINTS
 # ================================
+MAX_POLL_BATCH = 10
+QUESTION_INSERT_CHUNK_SIZE = int(os.getenv('QUESTION_INSERT_CHUNK_SIZE', 500))
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 30 * 60))
+HEARTBEAT_STALE_SECONDS = int(os.getenv('HEARTBEAT_STALE_SECONDS', 2 * 60))
+MAX_JOB_ATTEMPTS = int(os.getenv('MAX_JOB_ATTEMPTS', 3))
+LEASE_REAPER_INTERVAL = 60
+MAX_POLL_WAIT = 30  # seconds a long-poll may be held open
+
+# Long-poll wake-ups: bumped whenever a job becomes claimable so waiting pollers
+# re-check the DB only when there is something new, instead of on a timer.
+jobs_queued = threading.Condition()
+jobs_queued_generation = 0
+
+
+def notify_jobs_queued():
+    global jobs_queued_generation
+    with jobs_queued:
+        jobs_queued_generation += 1
+        jobs_queued.notify_all()
+
+
+def parse_metadata(raw):
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return {}
+
+
+def claim_rows(db, model, key, limit, claim, columns, *criteria, order_by=None):
+    """Atomically flip up to `limit` of the first rows matching criteria (oldest, or by order_by) to `claim` values.
+
+    A row is only ever handed to one poller: either a single UPDATE ... RETURNING
+    (SQLite >= 3.35) or, on backends without it, a per-row compare-and-set on the criteria.
+    """
+    oldest = select(key).where(*criteria).order_by(*(order_by or (model.created_at.asc(),))).limit(limit)
+
+    if engine.dialect.update_returning:
+        rows = db.execute(
+            update(model)
+            .where(key.in_(oldest), *criteria)
+            .values(**claim)
+            .returning(*columns)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+    else:
+        claimed = []
+        for value in db.execute(oldest).scalars().all():
+            result = db.execute(
+                update(model)
+                .where(key == value, *criteria)
+                .values(**claim)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                claimed.append(value)
+        db.commit()
+        rows = db.execute(select(*columns).where(key.in_(claimed))).all() if claimed else []
+
+    return sorted(rows, key=lambda r: r.created_at or datetime.min)
+
+
+def lease_values(model, pc_id, now):
+    return dict(
+        status="processing",
+        processed_at=now,
+        pc_processor=pc_id,
+        lease_expires_at=now + timedelta(seconds=JOB_LEASE_SECONDS),
+        attempts=func.coalesce(model.attempts, 0) + 1
+    )
+
+
+def claim_jobs(db, pc_id, limit=1, *criteria):
+    """Atomically lease up to `limit` queued jobs (in dispatch order, optionally narrowed by criteria) to pc_id"""
+    tag_untagged_jobs(db)
+    now = datetime.now()
+    rows = claim_rows(
+        db, Job, Job.job_id, limit, lease_values(Job, pc_id, now),
+        (Job.job_id, Job.filepath, Job.filename, Job.job_metadata, Job.created_at,
+         Job.priority, Job.queue_key, Job.queue_vtime),
+        Job.status == "queued", *criteria,
+        order_by=DISPATCH_ORDER
+    )
+    rows.sort(key=dispatch_sort_key)
+    note_dispatched(rows, now)
+    return [
+        {
+            "job_id": r.job_id,
+            "filepath": r.filepath,
+            "filename": r.filename,
+            "metadata": parse_metadata(r.job_metadata)
+        } for r in rows
+    ]
+
+
+# ================================
+# Page-level sharding
+# ================================
+# Workers that poll with ?shards=1 may receive a page range of a large PDF instead of
+# the whole file: {"job_id", "shard_id", "page_start", "page_end", "filepath", ...}.
+# They upload results with the same shard_id; the job completes once every shard has,
+# with MMD and questions merged in page order. Other workers only ever get whole jobs.
+SHARD_PAGES = int(os.getenv('SHARD_PAGES', 50))
+PDF_PAGE_PATTERN = re.compile(rb"/Type\s*/Page(?![A-Za-z])")
+
+
+def count_pdf_pages(filepath):
+    """Page count of a PDF, or None if it can't be determined"""
+    try:
+        if PdfReader is not None:
+            return len(PdfReader(filepath).pages)
+        # Without pypdf, count page objects in the raw file (misses compressed object streams)
+        with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return sum(1 for _ in PDF_PAGE_PATTERN.finditer(data)) or None
+    except Exception as e:
+        print(f"⚠️ Could not count pages of {filepath}: {e}")
+        return None
+
+
+def shard_payloads(db, rows):
+    jobs = {j.job_id: j for j in db.query(Job).filter(Job.job_id.in_({r.job_id for r in rows})).all()}
+    return [
+        {
+            "job_id": r.job_id,
+            "shard_id": r.shard_id,
+            "page_start": r.page_start,
+            "page_end": r.page_end,
+            "filepath": jobs[r.job_id].filepath,
+            "filename": jobs[r.job_id].filename,
+            "metadata": parse_metadata(jobs[r.job_id].job_metadata)
+        } for r in rows
+    ]
+
+
+def claim_shards(db, pc_id, limit=1):
+    """Atomically lease up to `limit` queued shards (oldest job first) to pc_id"""
+    rows = claim_rows(
+        db, JobShard, JobShard.shard_id, limit, lease_values(JobShard, pc_id, datetime.now()),
+        (JobShard.shard_id, JobShard.job_id, JobShard.page_start, JobShard.page_end, JobShard.created_at),
+        JobShard.status == "queued"
+    )
+    return shard_payloads(db, rows) if rows else []
+
+
+def split_into_shards(db, payload, pc_id):
+    """Split a just-claimed job into SHARD_PAGES-page shards if it is large enough.
+
+    pc_id keeps the first shard; the rest are queued for other workers. Returns the payload
+    to hand back to pc_id: the first shard, or the unchanged job if it was not split.
+    """
+    job = db.get(Job, payload["job_id"])
+    pages = job.page_count or count_pdf_pages(payload["filepath"])  # counted at enqueue; older rows may lack it
+    if not pages or pages <= SHARD_PAGES:
+        return payload
+
+    now = datetime.now()
+    shard_count = -(-pages // SHARD_PAGES)
+    shards = []
+    for index in range(shard_count):
+        shard = JobShard(
+            shard_id=f"{job.job_id}:{index}",
+            job_id=job.job_id,
+            shard_index=index,
+            page_start=index * SHARD_PAGES + 1,
+            page_end=min(pages, (index + 1) * SHARD_PAGES),
+            status="queued",
+            created_at=job.created_at,
+            attempts=0
+        )
+        if index == 0:
+            shard.status = "processing"
+            shard.processed_at = now
+            shard.pc_processor = pc_id
+            shard.lease_expires_at = now + timedelta(seconds=JOB_LEASE_SECONDS)
+            shard.attempts = 1
+        shards.append(shard)
+    db.add_all(shards)
+
+    # The job itself is no longer leased; its shards are
+    job.page_count = pages
+    job.shard_count = shard_count
+    job.pc_processor = None
+    job.lease_expires_at = None
+    db.commit()
+    notify_jobs_queued()
+    return shard_payloads(db, shards[:1])[0]
+
+
+def claim_work(db, pc_id, limit, shards):
+    """Jobs for a poll: whole jobs only, or, for shard-aware workers, shards first, then jobs (split when large)"""
+    if not shards:
+        return claim_scheduled_jobs(db, pc_id, limit, shards)
+
+    work = claim_shards(db, pc_id, limit)
+    if len(work) < limit:
+        work += [split_into_shards(db, job, pc_id) for job in claim_scheduled_jobs(db, pc_id, limit - len(work), shards)]
+    return work
+
+
+# ================================
+# Capability-aware scheduling
+# ================================
+# FIFO hands a 300-page book to whichever PC polls first. Instead, among the next
+# SCHEDULING_WINDOW queued jobs (in dispatch order, same priority), a polling PC gets the job whose size rank matches its
+# speed rank in the online fleet: the fastest PC takes the largest job, the slowest the
+# smallest, so big books finish on fast GPUs and the fleet's makespan shrinks. Work
+# never waits behind later jobs (only the next window is considered), a lone PC or one
+# without a measured throughput keeps plain FIFO, and a PC reporting a `max_pages`
+# capability is never handed a larger whole PDF. Shards are all SHARD_PAGES long, so they stay FIFO.
+SCHEDULING_WINDOW = int(os.getenv('SCHEDULING_WINDOW', 20))
+
+
+def job_size_criteria(pc_id, shards):
+    """Jobs pc_id can take: shard-aware workers can take anything (large PDFs get split)"""
+    max_pages = processor_capabilities(pc_id).get('max_pages')
+    if shards or not isinstance(max_pages, (int, float)):
+        return []
+    return [or_(Job.page_count.is_(None), Job.page_count <= max_pages)]
+
+
+def schedule_jobs(db, pc_id, limit, shards):
+    """job_ids of up to `limit` queued jobs that suit pc_id best, or None for plain FIFO"""
+    rates = online_throughputs(datetime.now())
+    me = registry_id(pc_id)
+    if me not in rates or len(rates) < 2:
+        return None
+
+    window = db.execute(
+        select(Job.job_id, Job.page_count, Job.priority)
+        .where(Job.status == "queued", *job_size_criteria(pc_id, shards))
+        .order_by(*DISPATCH_ORDER)
+        .limit(SCHEDULING_WINDOW)
+    ).all()
+    window = [w for w in window if w.priority == window[0].priority] if window else []  # never skip a priority level
+    if len(window) <= limit:
+        return None
+
+    known = sorted(w.page_count for w in window if w.page_count)
+    typical = known[len(known) // 2] if known else 0
+    by_size = sorted(window, key=lambda w: w.page_count or typical, reverse=True)
+
+    faster = sum(rate > rates[me] for rate in rates.values())
+    position = round(faster * (len(by_size) - 1) / (len(rates) - 1))
+    start = max(0, min(position, len(by_size) - limit))
+    return [w.job_id for w in by_size[start:start + limit]]
+
+
+def backfill_queued_page_counts():
+    """Jobs queued before page counts were taken at upload"""
+    db = SessionLocal()
+    try:
+        for job in db.query(Job).filter(Job.status == "queued", Job.page_count.is_(None)).all():
+            if os.path.exists(job.filepath):
+                job.page_count = count_pdf_pages(job.filepath)
+        db.commit()
+    finally:
+        db.close()
+
+
+backfill_queued_page_counts()
+
+
+def claim_scheduled_jobs(db, pc_id, limit, shards):
+    criteria = job_size_criteria(pc_id, shards)
+    chosen = schedule_jobs(db, pc_id, limit, shards)
+    jobs = claim_jobs(db, pc_id, len(chosen), Job.job_id.in_(chosen)) if chosen else []
+    if len(jobs) < limit:
+        # FIFO, or a concurrent poll took some of the chosen jobs
+        jobs += claim_jobs(db, pc_id, limit - len(jobs), *criteria)
+    return jobs
+
+
+# ================================
+# Priority and fair-share queues
+# ================================
+# Every job belongs to a queue named after FAIR_SHARE_FIELDS of its metadata (by default
+# its user_id, e.g. "user_id=7"). Priority levels are strict: a higher level is always
+# dispatched first. Within a level, queues share the fleet in proportion to their weights
+# (QUEUE_WEIGHTS, default 1) by start-time fair queuing: a new job's tag is
+#     start = max(virtual clock, finish of its queue's previous job)
+#     finish = start + pages / weight
+# and the smallest tag is dispatched next (the clock advances to it). 200 PDFs from one
+# user therefore interleave with everyone else's uploads instead of running first.
+# The dispatch query is an index range scan on ix_jobs_dispatch.
+FAIR_SHARE_FIELDS = [f.strip() for f in os.getenv('FAIR_SHARE_FIELDS', 'user_id').split(',') if f.strip()]
+QUEUE_WEIGHTS = json.loads(os.getenv('QUEUE_WEIGHTS', '{}'))  # e.g. {"user_id=7": 2, "default": 0.5}
+QUEUE_WAIT_SAMPLES = 200  # recent dispatches per queue used for wait-time stats
+DISPATCH_ORDER = (Job.priority.desc(), Job.queue_vtime.asc(), Job.created_at.asc())
+
+fair_queue_lock = threading.Lock()
+virtual_clock = 0.0
+queue_finish = {}  # queue_key -> finish tag of its last queued job
+queue_waits = {}  # queue_key -> deque of recent upload -> dispatch waits (seconds)
+
+
+def priority_name(level):
+    return next((name for name, value in PRIORITY_LEVELS.items() if value == level), str(level))
+
+
+def queue_key_for(metadata):
+    parts = [f"{field}={metadata[field]}" for field in FAIR_SHARE_FIELDS if metadata.get(field) not in (None, '')]
+    return ",".join(parts) or "default"
+
+
+def queue_weight(key):
+    try:
+        return max(float(QUEUE_WEIGHTS.get(key, 1)), 0.01)
+    except (TypeError, ValueError):
+        return 1.0
+
+
+def assign_queue_tag(metadata, page_count):
+    """(priority, queue_key, start tag) for a newly queued job"""
+    key = queue_key_for(metadata)
+    with fair_queue_lock:
+        start = max(virtual_clock, queue_finish.get(key, 0.0))
+        queue_finish[key] = start + (page_count or 1) / queue_weight(key)
+    return job_priority(metadata), key, start
+
+
+def dispatch_sort_key(row):
+    return (-(row.priority or 0), row.queue_vtime if row.queue_vtime is not None else float("-inf"), row.created_at or datetime.min)
+
+
+def note_dispatched(rows, now):
+    global virtual_clock
+    with fair_queue_lock:
+        for r in rows:
+            if r.queue_vtime is not None:
+                virtual_clock = max(virtual_clock, r.queue_vtime)
+            if r.created_at:
+                queue_waits.setdefault(r.queue_key or "default", deque(maxlen=QUEUE_WAIT_SAMPLES)).append(
+                    (now - r.created_at).total_seconds()
+                )
+
+
+def tag_untagged_jobs(db):
+    """Give jobs queued without a fair-share tag (e.g. by storage.py's SQLStore) their tag, oldest first"""
+    untagged = db.query(Job).filter(Job.status == "queued", Job.queue_key.is_(None)).order_by(Job.created_at.asc()).all()
+    for job in untagged:
+        job.priority, job.queue_key, job.queue_vtime = assign_queue_tag(parse_metadata(job.job_metadata), job.page_count)
+    if untagged:
+        db.commit()
+
+
+def load_fair_queue_state():
+    """Tag jobs queued before fair queuing existed and rebuild the virtual clock / queue finish tags"""
+    global virtual_clock
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(Job).where(Job.priority.is_(None)).values(priority=0).execution_options(synchronize_session=False)
+        )
+        virtual_clock = db.execute(
+            select(func.max(Job.queue_vtime)).where(Job.status != "queued")
+        ).scalar() or 0.0
+        for job in db.query(Job).filter(Job.status == "queued", Job.queue_key.isnot(None)).all():
+            finish = job.queue_vtime + (job.page_count or 1) / queue_weight(job.queue_key)
+            queue_finish[job.queue_key] = max(queue_finish.get(job.queue_key, 0.0), finish)
+        db.commit()
+        tag_untagged_jobs(db)
+    finally:
+        db.close()
+
+
+load_fair_queue_state()
+
+
+@app.route('/api/queue/stats', methods=['GET'])
+def queue_stats():
+    """Per queue: depth by priority, jobs processing, oldest queued job's wait and recent dispatch waits"""
+    now = datetime.now()
+    db = SessionLocal()
+    try:
+        queued = db.execute(
+            select(Job.queue_key, Job.priority, func.count(), func.min(Job.created_at))
+            .where(Job.status == "queued")
+            .group_by(Job.queue_key, Job.priority)
+        ).all()
+        processing = dict(db.execute(
+            select(Job.queue_key, func.count()).where(Job.status == "processing").group_by(Job.queue_key)
+        ).all())
+    finally:
+        db.close()
+
+    with fair_queue_lock:
+        waits = {key: list(samples) for key, samples in queue_waits.items()}
+        clock = virtual_clock
+    queues = {}
+
+    def entry(key):
+        key = key or "default"
+        return queues.setdefault(key, {
+            'queue': key, 'weight': queue_weight(key), 'queued': 0, 'queued_by_priority': {},
+            'processing': 0, 'oldest_queued_seconds': None
+        })
+
+    for key, priority, depth, oldest in queued:
+        q = entry(key)
+        q['queued'] += depth
+        q['queued_by_priority'][priority_name(priority or 0)] = depth
+        if oldest:
+            q['oldest_queued_seconds'] = max(q['oldest_queued_seconds'] or 0, round((now - oldest).total_seconds()))
+    for key, count in processing.items():
+        entry(key)['processing'] += count
+    for key, samples in waits.items():
+        q = entry(key)
+        q['recent_dispatches'] = len(samples)
+        q['avg_wait_seconds'] = round(sum(samples) / len(samples), 1) if samples else None
+        q['max_wait_seconds'] = round(max(samples), 1) if samples else None
+
+    return jsonify({
+        'queues': sorted(queues.values(), key=lambda q: (-q['queued'], q['queue'])),
+        'fair_share_fields': FAIR_SHARE_FIELDS,
+        'virtual_clock': round(clock, 3)
+    })
+
+
 @app.route('/api/poll', methods=['GET'])
 def poll_for_jobs():
+    """Lease the next queued job. With ?batch=N, lease up to N jobs and return them as {"jobs": [...]}.
+
+    With ?wait=S the request is held open for up to S seconds until a job is queued
+    (long-poll); without it the response is immediate, as before. With ?shards=1 the
+    worker may also receive page-range shards of large PDFs.
+    """
+    pc_id = request.args.get('pc_id', request.remote_addr)
+    note_processor_address(pc_id, request.remote_addr)
+    batch = request.args.get('batch', type=int)
+    shards = bool(request.args.get('shards', 0, type=int))
+    wait = max(0, min(request.args.get('wait', 0, type=float), MAX_POLL_WAIT))
+    limit = 1 if batch is None else max(1, min(batch, MAX_POLL_BATCH))
+    deadline = time.monotonic() + wait
+
     db = SessionLocal()
     try:
-        job = db.query(Job).filter(Job.status == "queued").order_by(Job.created_at.asc()).first()
-        if job:
-            job.status = "processing"
-            job.processed_at = datetime.now()
-            job.pc_processor = request.remote_addr
-            db.commit()
-            
-            # Parse metadata if available
-            metadata = {}
-            if job.job_metadata:
-                try:
-                    metadata = json.loads(job.job_metadata)
-                except json.JSONDecodeError:
-                    metadata = {}
-            
-            return jsonify({
-                "job_id": job.job_id,
-                "filepath": job.filepath,
-                "filename": job.filename,
-                "metadata": metadata
-            })
+        while True:
+            seen = jobs_queued_generation
+            jobs = claim_work(db, pc_id, limit, shards)
+            remaining = deadline - time.monotonic()
+            if jobs or remaining <= 0:
+                break
+            with jobs_queued:
+                jobs_queued.wait_for(lambda: jobs_queued_generation != seen, timeout=remaining)
+
+        if jobs:
+            publish_job_events(db, {job["job_id"] for job in jobs})
+        if batch is not None:
+            return jsonify({"jobs": jobs})
+        if jobs:
+            return jsonify(jobs[0])
         return jsonify({"message": "No jobs available"})
     finally:
         db.close()
 
 
+def question_row(job_id, q, now):
+    question_text = (q.get('question') or '').strip()
+    answer_text = (q.get('answer') or '').strip()
+    return dict(
+        job_id=job_id,
+        created_at=now,
+        question=question_text,
+        option1=q.get('option1', ''),
+        option2=q.get('option2', ''),
+        option3=q.get('option3', ''),
+        option4=q.get('option4', ''),
+        answer=answer_text,
+        explanation=q.get('explanation', ''),
+        solution=q.get('solution', ''),
+        asked=q.get('asked', ''),
+        asked_status=q.get('asked_status', ''),
+        date=q.get('date'),
+        marks=q.get('marks'),
+        question_category=q.get('question_category', ''),
+        status=q.get('status', ''),
+        chapter_master_chapter_id=q.get('chapter_master_chapter_id'),
+        entrance_exam_master_entrance_exam_id=q.get('entrance_exam_master_entrance_exam_id'),
+        pattern_master_pattern_id=q.get('pattern_master_pattern_id'),
+        question_level_question_level_id=q.get('question_level_question_level_id'),
+        question_type_question_type_id=q.get('question_type_question_type_id'),
+        standard_master_standard_id=q.get('standard_master_standard_id'),
+        sub_topic_master_sub_topic_id=q.get('sub_topic_master_sub_topic_id'),
+        subject_master_subject_id=q.get('subject_master_subject_id'),
+        topic_master_topic_id=q.get('topic_master_topic_id'),
+        user_id=q.get('user_id'),
+        year_of_appearance_year_of_appearance_id=q.get('year_of_appearance_year_of_appearance_id'),
+        content_hash=question_content_hash(question_text, answer_text)
+    )
+
+
+def insert_questions_ignoring_duplicates():
+    """INSERT that silently skips rows whose content_hash is already stored (or repeated in the batch)"""
+    if engine.dialect.name == "sqlite":
+        return sqlite_insert(Question.__table__).on_conflict_do_nothing()
+    return insert(Question.__table__).prefix_with("IGNORE")  # MySQL
+
+
+def bulk_insert_questions(rows, chunk_size=None):
+    """executemany-insert question rows, one transaction per chunk. Returns the number actually inserted.
+
+    A failed upload can simply be retried: chunks that already committed are skipped as duplicates.
+    """
+    chunk_size = chunk_size or QUESTION_INSERT_CHUNK_SIZE
+    stmt = insert_questions_ignoring_duplicates()
+    inserted = 0
+    for start in range(0, len(rows), chunk_size):
+        with engine.begin() as conn:
+            inserted += conn.execute(stmt, rows[start:start + chunk_size]).rowcount
+    return inserted
+
+
+def result_sender():
+    data = request.get_json(silent=True) or {}
+    return data.get('pc_id') or request.args.get('pc_id') or request.remote_addr
+
+
+def reject_results(job, shard, sender):
+    """Response for results that must not be (re-)ingested, or None to accept them.
+
+    Results for finished work are acknowledged without ingesting them again; results for
+    work that was requeued or leased to another PC (e.g. after the lease reaper) are refused.
+    """
+    work = shard or job
+    if work.status == "completed":
+        return jsonify({'message': 'Results already ingested', 'questions_count': job.questions_count}), 200
+    if work.status == "ingesting":
+        return None  # a retry of an upload we already hold; accept_results returns it
+    if work.status != "processing":
+        return jsonify({'error': f'Job is {work.status}, not processing; results refused'}), 409
+    if not sent_by_lease_holder(work.pc_processor, sender, request.remote_addr):
+        return jsonify({'error': 'Job is leased to another PC; results refused'}), 409
+    return None
+
+
 @app.route('/api/upload_results', methods=['POST'])
 def upload_results():
+    """Accept a PC's results: errors are recorded at once, questions + MMD are spooled and
+    ingested in the background (202), so the PC can move on to its next PDF"""
     data = request.get_json()
     job_id = data.get('job_id')
     questions = data.get('questions', [])
@@ -464,93 +2349,977 @@ def upload_results():
         if not job:
             return jsonify({'error': 'Job not found'}), 404
 
+        shard = None
+        if job.shard_count:
+            if not data.get('shard_id'):
+                return jsonify({'error': 'This job is sharded; shard_id required'}), 400
+            shard = db.get(JobShard, data['shard_id'])
+            if not shard or shard.job_id != job.job_id:
+                return jsonify({'error': 'Shard not found'}), 404
+
+        rejection = reject_results(job, shard, result_sender())
+        if rejection:
+            return rejection
+
         if error_message:
-            job.status = "error"
-            job.error_message = error_message
-            job.completed_at = datetime.now()
-            db.commit()
+            if shard:
+                record_shard_error(db, job, shard, error_message)
+            else:
+                job.status = "error"
+                job.error_message = error_message
+                job.completed_at = datetime.now()
+                db.commit()
+            publish_job_events(db, [job_id])
             return jsonify({'message': 'Error recorded'})
 
-        saved = 0
-        for q in questions:
-            # Duplicate prevention: exact match on normalized question+answer
-            question_text = (q.get('question') or '').strip()
-            answer_text = (q.get('answer') or '').strip()
-            if question_text:
-                existing = db.query(Question).filter(
-                    func.lower(func.trim(Question.question)) == question_text.lower(),
-                    func.lower(func.trim(Question.answer)) == answer_text.lower()
-                ).first()
-                if existing:
-                    continue
+        upload = accept_results(db, job, shard, questions, mmd_content)
+        if upload is None:
+            return jsonify({'error': 'Ingest backlog is full, retry later'}), 503, {'Retry-After': str(INGEST_RETRY_AFTER)}
+        publish_job_events(db, [job_id])
+        return jsonify({
+            'message': 'Results accepted for ingestion',
+            'upload_id': upload.upload_id,
+            'status_url': url_for('get_status', job_id=job_id)
+        }), 202
+    finally:
+        db.close()
+
+
+def batched(items, size):
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+def complete_job(db, job, questions, mmd_content):
+    """Insert the questions (any iterable; only one chunk is held at a time) and complete the job.
+
+    mmd_content=None means the caller has already stored the job's MMD.
+    """
+    now = datetime.now()
+    started = time.perf_counter()
+    received = saved = 0
+    for batch in batched(questions, QUESTION_INSERT_CHUNK_SIZE):
+        received += len(batch)
+        saved += bulk_insert_questions([question_row(job.job_id, q, now) for q in batch])
+    elapsed = time.perf_counter() - started
+
+    job.status = "completed"
+    # Chunks commit independently, so a retried ingest only inserts what is missing; count what is stored
+    job.questions_count = db.execute(select(func.count()).where(Question.job_id == job.job_id)).scalar()
+    job.completed_at = datetime.now()
+    if mmd_content is not None:
+        store_mmd(job.job_id, mmd_content)
+    job.mmd_content = None
+    db.commit()
+
+    return {
+        'questions_received': received,
+        'questions_count': job.questions_count,
+        'questions_inserted': saved,
+        'rows_per_sec': round(received / elapsed) if elapsed > 0 else None
+    }
+
+
+def fail_sharded_job(db, job_id, message):
+    """Mark a sharded job as failed and stop handing out its remaining shards"""
+    now = datetime.now()
+    db.execute(
+        update(JobShard)
+        .where(JobShard.job_id == job_id, JobShard.status.in_(("queued", "processing", "ingesting")))
+        .values(status="cancelled", lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(
+        update(Job)
+        .where(Job.job_id == job_id, Job.status != "error")
+        .values(status="error", error_message=message, completed_at=now)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def record_shard_error(db, job, shard, error_message):
+    shard.status = "error"
+    shard.completed_at = datetime.now()
+    fail_sharded_job(db, job.job_id, f"Pages {shard.page_start}-{shard.page_end}: {error_message}")
+    db.commit()
+    discard_shard_results(job.job_id)
+
+
+def record_shard_results(db, upload, job, shard):
+    """Keep a shard's spooled results (files, not rows) until the last shard arrives, then merge"""
+    received = keep_shard_results(upload.upload_id, shard)
+    shard.status = "completed"
+    shard.completed_at = datetime.now()
+    shard.lease_expires_at = None
+    db.flush()
+
+    remaining = db.query(JobShard).filter(JobShard.job_id == job.job_id, JobShard.status != "completed").count()
+    if remaining:
+        return {'questions_received': received, 'shards_remaining': remaining}
+
+    # Last shard in: exactly one ingest wins the right to merge, and the job turns "ingesting"
+    # in the same commit as the shard
+    won = db.execute(
+        update(Job)
+        .where(Job.job_id == job.job_id, Job.status == "processing")
+        .values(status="ingesting", lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not won:
+        return {'questions_received': received, 'shards_remaining': 0}
+    # The upload stays claimed until the merge commits, so a failed or interrupted merge is
+    # retried like any other ingest (and fails the job after INGEST_MAX_ATTEMPTS)
+    upload.status = "ingesting"
+    db.commit()
+    db.refresh(job)
+    return merge_shard_results(db, upload, job)
+
+
+def merge_shard_results(db, upload, job):
+    """Stream the completed shards' results into the job in page order and complete it.
+
+    Questions go in chunk by chunk and the shards' MMD files are recompressed one after
+    another, so memory stays bounded however many shards the job has.
+    """
+    shards = db.query(JobShard).filter(JobShard.job_id == job.job_id).order_by(JobShard.shard_index.asc()).all()
+    store_mmd_parts(job.job_id, [os.path.join(shard_results_dir(s), "mmd.gz") for s in shards])
+    questions = (q for s in shards for q in iter_ndjson_parts(shard_results_dir(s)))
+    upload.status = "done"  # commits with the completed job
+    result = complete_job(db, job, questions, None)
+    discard_shard_results(job.job_id)
+    return result
+
+
+# ================================
+# Asynchronous result ingestion
+# ================================
+# Results are spooled under INGEST_FOLDER/<upload_id>/ (gzipped NDJSON question parts plus
+# the MMD) with a result_uploads row, and the job/shard flips to "ingesting"; INGEST_WORKERS
+# background threads then dedupe + insert the questions, store the MMD and complete the job.
+# Ingestion is idempotent (duplicate questions are skipped), so uploads interrupted by a
+# restart are simply run again.
+#
+# Small results can be sent in one POST /api/upload_results. Large ones use a session,
+# so nothing is ever parsed whole and a failed request only resends one part:
+# 1. POST /api/results/sessions                        job_id, [shard_id] (an open session is resumed)
+# 2. PUT  /api/results/sessions/<id>/questions/<seq>    NDJSON, one question per line
+# 3. PUT  /api/results/sessions/<id>/mmd                the Nougat markdown
+#    Bodies may be Content-Encoding: gzip or zstd; re-sending a part replaces it, and an
+#    optional X-Chunk-SHA256 header is checked against the decoded bytes.
+# 4. GET  /api/results/sessions/<id>                    which parts arrived
+# 5. POST /api/results/sessions/<id>/commit             parts -> queued for ingestion (202)
+INGEST_FOLDER = os.getenv('INGEST_FOLDER', 'ingest')
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 1))  # SQLite has one writer; more only helps other backends
+MAX_PENDING_INGESTS = int(os.getenv('MAX_PENDING_INGESTS', 100))  # beyond this upload_results answers 503
+INGEST_MAX_ATTEMPTS = 3
+INGEST_RETRY_AFTER = 5  # seconds, sent with 503
+INGEST_IDLE_WAIT = 30  # seconds between sweeps when nothing was signalled
+MAX_RESULT_PART_SIZE = int(os.getenv('MAX_RESULT_PART_SIZE', 64 * 1024 * 1024))  # decoded bytes per part / MMD
+os.makedirs(INGEST_FOLDER, exist_ok=True)
+
+ingest_pending = threading.Condition()
+ingest_pending_generation = 0
+
+
+def notify_ingest_pending():
+    global ingest_pending_generation
+    with ingest_pending:
+        ingest_pending_generation += 1
+        ingest_pending.notify_all()
+
+
+def spool_dir(upload_id):
+    return os.path.join(INGEST_FOLDER, secure_filename(upload_id))
+
+
+def spool_part_path(upload_id, seq):
+    return os.path.join(spool_dir(upload_id), f"questions-{seq:06d}.ndjson.gz")
+
+
+def spool_mmd_path(upload_id):
+    return os.path.join(spool_dir(upload_id), "mmd.gz")
+
+
+def spooled_parts(upload_id):
+    try:
+        names = os.listdir(spool_dir(upload_id))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[10:16]) for name in names if name.startswith("questions-") and name.endswith(".ndjson.gz"))
+
+
+def discard_spool(upload_id):
+    shutil.rmtree(spool_dir(upload_id), ignore_errors=True)
+
+
+def write_spool_file(path, read, digest=None, limit=None):
+    """Gzip read() blocks into path atomically and durably; returns the number of bytes read.
+
+    Nothing is written when more than `limit` bytes arrive.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=1) as out:
+            written = stream_to_file(read, out, digest or hashlib.sha256(), limit=limit)
+        raw.flush()
+        os.fsync(raw.fileno())  # on disk before the row that points at it is committed
+    if limit is not None and written > limit:
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, path)
+    return written
+
+
+def count_ndjson_lines(path):
+    """Number of questions in a spooled part; ValueError if a line is not a JSON object"""
+    count = 0
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                question = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"line {number}: {e.msg}")
+            if not isinstance(question, dict):
+                raise ValueError(f"line {number} is not a JSON object")
+            count += 1
+    return count
+
+
+def iter_ndjson_parts(directory):
+    """Questions from the questions-*.ndjson.gz parts in directory, in part order"""
+    try:
+        names = sorted(n for n in os.listdir(directory) if n.startswith("questions-") and n.endswith(".ndjson.gz"))
+    except FileNotFoundError:
+        return
+    for name in names:
+        with gzip.open(os.path.join(directory, name), "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def iter_spooled_questions(upload_id):
+    return iter_ndjson_parts(spool_dir(upload_id))
+
+
+def write_ingest_payload(upload_id, questions, mmd_content):
+    """Spool a one-shot upload in the same layout as a session: one NDJSON part + the MMD"""
+    lines = iter(json.dumps(q).encode("utf-8") + b"\n" for q in questions)
+    write_spool_file(spool_part_path(upload_id, 0), lambda size: next(lines, b""))
+    mmd = [(mmd_content or '').encode("utf-8")]
+    write_spool_file(spool_mmd_path(upload_id), lambda size: mmd.pop() if mmd else b"")
+
+
+def shard_results_dir(shard):
+    return os.path.join(INGEST_FOLDER, "shards", secure_filename(shard.job_id), f"{shard.shard_index:06d}")
+
+
+def keep_shard_results(upload_id, shard):
+    """Copy an upload's spooled parts + MMD to where the shard's results wait for the merge;
+    returns the number of questions"""
+    target = shard_results_dir(shard)
+    shutil.rmtree(target, ignore_errors=True)  # a retried ingest replaces what an earlier attempt copied
+    shutil.copytree(spool_dir(upload_id), target)
+    return sum(1 for _ in iter_ndjson_parts(target))
+
+
+def discard_shard_results(job_id):
+    shutil.rmtree(os.path.join(INGEST_FOLDER, "shards", secure_filename(job_id)), ignore_errors=True)
+
+
+def move_inline_shard_results_to_files():
+    """Move shard results stored inline by older versions out of the job_shards table"""
+    db = SessionLocal()
+    try:
+        for shard in db.query(JobShard).filter(or_(JobShard.results.is_not(None), JobShard.mmd_content.is_not(None))):
+            target = shard_results_dir(shard)
+            lines = iter(json.dumps(q).encode("utf-8") + b"\n" for q in json.loads(shard.results or '[]'))
+            write_spool_file(os.path.join(target, "questions-000000.ndjson.gz"), lambda size: next(lines, b""))
+            mmd = [(shard.mmd_content or '').encode("utf-8")]
+            write_spool_file(os.path.join(target, "mmd.gz"), lambda size: mmd.pop() if mmd else b"")
+            shard.results = None
+            shard.mmd_content = None
+            db.commit()
+    finally:
+        db.close()
 
-            q_row = Question(
-                job_id=job_id,
-                created_at=datetime.now(),
-                question=question_text,
-                option1=q.get('option1', ''),
-                option2=q.get('option2', ''),
-                option3=q.get('option3', ''),
-                option4=q.get('option4', ''),
-                answer=answer_text,
-                explanation=q.get('explanation', ''),
-                solution=q.get('solution', ''),
-                asked=q.get('asked', ''),
-                asked_status=q.get('asked_status', ''),
-                date=q.get('date'),
-                marks=q.get('marks'),
-                question_category=q.get('question_category', ''),
-                status=q.get('status', ''),
-                chapter_master_chapter_id=q.get('chapter_master_chapter_id'),
-                entrance_exam_master_entrance_exam_id=q.get('entrance_exam_master_entrance_exam_id'),
-                pattern_master_pattern_id=q.get('pattern_master_pattern_id'),
-                question_level_question_level_id=q.get('question_level_question_level_id'),
-                question_type_question_type_id=q.get('question_type_question_type_id'),
-                standard_master_standard_id=q.get('standard_master_standard_id'),
-                sub_topic_master_sub_topic_id=q.get('sub_topic_master_sub_topic_id'),
-                subject_master_subject_id=q.get('subject_master_subject_id'),
-                topic_master_topic_id=q.get('topic_master_topic_id'),
-                user_id=q.get('user_id'),
-                year_of_appearance_year_of_appearance_id=q.get('year_of_appearance_year_of_appearance_id')
-            )
-            db.add(q_row)
-            saved += 1
 
-        job.status = "completed"
-        job.questions_count = saved
-        job.completed_at = datetime.now()
-        job.mmd_content = mmd_content
+move_inline_shard_results_to_files()
+
+
+UNFINISHED_UPLOAD = ResultUpload.status.in_(("pending", "ingesting"))
+
+
+def find_unfinished_upload(db, job_id, shard_id):
+    return db.query(ResultUpload).filter(
+        ResultUpload.job_id == job_id, ResultUpload.shard_id == shard_id, UNFINISHED_UPLOAD
+    ).first()
+
+
+def ingest_backlog_full(db):
+    return db.query(ResultUpload).filter(UNFINISHED_UPLOAD).count() >= MAX_PENDING_INGESTS
+
+
+def queue_upload(db, upload, job, shard):
+    """Hand a fully spooled upload to the ingest workers"""
+    if shard:
+        record_throughput(shard.pc_processor, shard.page_end - shard.page_start + 1, shard.processed_at)
+    else:
+        record_throughput(job.pc_processor, job.page_count, job.processed_at)
+    upload.status = "pending"
+    upload.created_at = datetime.now()  # ingest order is commit order
+    target = shard or job
+    target.status = "ingesting"
+    target.lease_expires_at = None  # the PC is done; the lease reaper leaves "ingesting" alone
+    db.commit()
+    notify_ingest_pending()
+
+
+def accept_results(db, job, shard, questions, mmd_content):
+    """Durably queue one-shot results for ingestion; None when the backlog is full"""
+    shard_id = shard.shard_id if shard else None
+    existing = find_unfinished_upload(db, job.job_id, shard_id)
+    if existing:
+        return existing  # the PC retried an upload we already hold
+    if ingest_backlog_full(db):
+        return None
+
+    upload = ResultUpload(
+        upload_id=str(uuid.uuid4()),
+        job_id=job.job_id,
+        shard_id=shard_id,
+        questions_received=len(questions)
+    )
+    write_ingest_payload(upload.upload_id, questions, mmd_content)
+    db.add(upload)
+    queue_upload(db, upload, job, shard)
+    return upload
+
+
+def result_session_status(upload):
+    return {
+        'upload_id': upload.upload_id,
+        'job_id': upload.job_id,
+        'shard_id': upload.shard_id,
+        'status': upload.status,
+        'received_parts': spooled_parts(upload.upload_id),
+        'has_mmd': os.path.exists(spool_mmd_path(upload.upload_id))
+    }
+
+
+def request_body_reader():
+    """read(size) over the request body with any gzip/zstd Content-Encoding undone; None if unsupported"""
+    encoding = (request.headers.get('Content-Encoding') or 'identity').strip().lower()
+    if encoding == 'identity':
+        return request.stream.read
+    if encoding == 'gzip':
+        return gzip.GzipFile(fileobj=request.stream, mode="rb").read
+    if encoding == 'zstd' and zstandard is not None:
+        return zstandard.ZstdDecompressor().stream_reader(request.stream).read
+    return None
+
+
+def receiving_session(db, upload_id):
+    upload = db.get(ResultUpload, upload_id)
+    if not upload:
+        return None, (jsonify({'error': 'Result session not found'}), 404)
+    if upload.status != "receiving":
+        return None, (jsonify({'error': 'Result session already committed', 'status': upload.status}), 409)
+    return upload, None
+
+
+def spool_request_body(path):
+    """Decode + spool the request body to path; returns (bytes, None) or (None, error response)"""
+    read = request_body_reader()
+    if read is None:
+        supported = "gzip, zstd" if zstandard is not None else "gzip"
+        return None, (jsonify({'error': f'Unsupported Content-Encoding (use identity or {supported})'}), 415)
+
+    digest = hashlib.sha256()
+    try:
+        written = write_spool_file(path, read, digest, limit=MAX_RESULT_PART_SIZE)
+    except (OSError, EOFError, zlib.error) as e:  # corrupt or truncated compressed body
+        return None, (jsonify({'error': f'Could not decode request body: {e}'}), 400)
+    if written > MAX_RESULT_PART_SIZE:
+        return None, (jsonify({'error': f'Parts are limited to {MAX_RESULT_PART_SIZE} decoded bytes'}), 413)
+
+    checksum = request.headers.get('X-Chunk-SHA256')
+    if checksum and checksum.lower() != digest.hexdigest():
+        os.remove(path)
+        return None, (jsonify({'error': 'Checksum mismatch'}), 400)
+    return written, None
+
+
+@app.route('/api/results/sessions', methods=['POST'])
+def create_result_session():
+    data = request.get_json(silent=True) or {}
+    job_id = data.get('job_id')
+    shard_id = data.get('shard_id')
+    if not job_id:
+        return jsonify({'error': 'Job ID required'}), 400
+
+    db = SessionLocal()
+    try:
+        job = db.get(Job, job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        if job.shard_count:
+            if not shard_id:
+                return jsonify({'error': 'This job is sharded; shard_id required'}), 400
+            shard = db.get(JobShard, shard_id)
+            if not shard or shard.job_id != job.job_id:
+                return jsonify({'error': 'Shard not found'}), 404
+        else:
+            shard, shard_id = None, None
+        rejection = reject_results(job, shard, result_sender())
+        if rejection:
+            return rejection
+
+        # Drop abandoned sessions so their parts don't pile up on disk
+        for stale in db.query(ResultUpload).filter(
+            ResultUpload.status == "receiving", ResultUpload.created_at < datetime.now() - UPLOAD_SESSION_TTL
+        ).all():
+            discard_spool(stale.upload_id)
+            db.delete(stale)
         db.commit()
 
-        return jsonify({
-            'message': 'Results uploaded successfully',
-            'questions_count': saved
-        })
+        session = db.query(ResultUpload).filter(
+            ResultUpload.job_id == job_id, ResultUpload.shard_id == shard_id, ResultUpload.status == "receiving"
+        ).first()
+        created = session is None
+        if created:
+            session = ResultUpload(upload_id=str(uuid.uuid4()), job_id=job_id, shard_id=shard_id, status="receiving")
+            db.add(session)
+            db.commit()
+            os.makedirs(spool_dir(session.upload_id), exist_ok=True)
+        return jsonify(result_session_status(session)), 201 if created else 200
     finally:
         db.close()
 
 
-@app.route('/api/heartbeat', methods=['POST'])
-def heartbeat():
-    data = request.get_json()
-    pc_id = data.get('pc_id', request.remote_addr)
+@app.route('/api/results/sessions/<upload_id>', methods=['GET'])
+def get_result_session(upload_id):
+    db = SessionLocal()
+    try:
+        upload = db.get(ResultUpload, upload_id)
+        if not upload:
+            return jsonify({'error': 'Result session not found'}), 404
+        return jsonify(result_session_status(upload))
+    finally:
+        db.close()
+
 
+@app.route('/api/results/sessions/<upload_id>', methods=['DELETE'])
+def abort_result_session(upload_id):
     db = SessionLocal()
     try:
-        proc = db.query(PCProcessor).filter(PCProcessor.pc_id == pc_id).first()
-        if not proc:
-            proc = PCProcessor(pc_id=pc_id)
-            db.add(proc)
-        proc.last_heartbeat = datetime.now()
-        proc.status = "online"
+        upload, error = receiving_session(db, upload_id)
+        if error:
+            return error
+        discard_spool(upload_id)
+        db.delete(upload)
         db.commit()
-        return jsonify({'message': 'Heartbeat received'})
+        return jsonify({'message': 'Result session cancelled'})
+    finally:
+        db.close()
+
+
+@app.route('/api/results/sessions/<upload_id>/questions/<int:seq>', methods=['PUT'])
+def upload_result_part(upload_id, seq):
+    """Spool one NDJSON batch of questions. Re-sending a sequence number replaces that part."""
+    db = SessionLocal()
+    try:
+        _, error = receiving_session(db, upload_id)
+    finally:
+        db.close()
+    if error:
+        return error
+    if seq < 0 or seq > 999999:
+        return jsonify({'error': 'Sequence number out of range'}), 400
+
+    path = spool_part_path(upload_id, seq)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+    size, error = spool_request_body(tmp_path)
+    if error:
+        return error
+    try:
+        count = count_ndjson_lines(tmp_path)
+    except (ValueError, UnicodeDecodeError) as e:
+        os.remove(tmp_path)
+        return jsonify({'error': f'Part {seq} is not valid NDJSON: {e}'}), 400
+    os.replace(tmp_path, path)
+    return jsonify({'seq': seq, 'size': size, 'questions': count})
+
+
+@app.route('/api/results/sessions/<upload_id>/mmd', methods=['PUT'])
+def upload_result_mmd(upload_id):
+    db = SessionLocal()
+    try:
+        _, error = receiving_session(db, upload_id)
+    finally:
+        db.close()
+    if error:
+        return error
+    size, error = spool_request_body(spool_mmd_path(upload_id))
+    if error:
+        return error
+    return jsonify({'size': size})
+
+
+@app.route('/api/results/sessions/<upload_id>/commit', methods=['POST'])
+def commit_result_session(upload_id):
+    """Close the session and queue it for ingestion; `parts` is how many question parts were sent"""
+    data = request.get_json(silent=True) or {}
+    db = SessionLocal()
+    try:
+        upload = db.get(ResultUpload, upload_id)
+        if not upload:
+            return jsonify({'error': 'Result session not found'}), 404
+        if upload.status != "receiving":
+            # Committing twice (e.g. after a lost response) is harmless
+            return jsonify({**result_session_status(upload), 'status_url': url_for('get_status', job_id=upload.job_id)}), 202
+
+        try:
+            parts = int(data.get('parts'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'parts (the number of question parts sent) required'}), 400
+        received = spooled_parts(upload_id)
+        missing = sorted(set(range(parts)) - set(received))
+        if missing or any(seq >= parts for seq in received):
+            return jsonify({'error': 'Parts do not match', 'missing_parts': missing, 'received_parts': received}), 409
+
+        job = db.get(Job, upload.job_id)
+        shard = db.get(JobShard, upload.shard_id) if upload.shard_id else None
+        if not job or (upload.shard_id and not shard):
+            return jsonify({'error': 'Job not found'}), 404
+        rejection = reject_results(job, shard, result_sender())
+        if rejection:
+            discard_spool(upload_id)
+            db.delete(upload)
+            db.commit()
+            return rejection
+        if find_unfinished_upload(db, upload.job_id, upload.shard_id):
+            return jsonify({'error': 'Results for this job are already being ingested'}), 409
+        if ingest_backlog_full(db):
+            return jsonify({'error': 'Ingest backlog is full, retry later'}), 503, {'Retry-After': str(INGEST_RETRY_AFTER)}
+
+        queue_upload(db, upload, job, shard)
+        publish_job_events(db, [upload.job_id])
+        return jsonify({**result_session_status(upload), 'status_url': url_for('get_status', job_id=upload.job_id)}), 202
+    finally:
+        db.close()
+
+
+def ingest_upload(db, upload):
+    """Apply one spooled upload; returns what complete_job/record_shard_results reported"""
+    job = db.get(Job, upload.job_id)
+    if upload.shard_id:
+        shard = db.get(JobShard, upload.shard_id)
+        if job and shard and shard.status == "completed" and job.status == "ingesting":
+            return merge_shard_results(db, upload, job)  # the merge failed or was interrupted last time
+        if not job or not shard or shard.status != "ingesting":
+            return {'skipped': True}  # the job failed or was cancelled meanwhile
+        return record_shard_results(db, upload, job, shard)
+    if not job or job.status != "ingesting":
+        return {'skipped': True}
+    if os.path.exists(spool_mmd_path(upload.upload_id)):
+        store_mmd_file(job.job_id, spool_mmd_path(upload.upload_id))
+        mmd_content = None
+    else:
+        mmd_content = ''
+    return complete_job(db, job, iter_spooled_questions(upload.upload_id), mmd_content)
+
+
+def fail_ingest(db, upload):
+    message = f"Ingest failed after {upload.attempts} attempts: {upload.error_message}"
+    if upload.shard_id:
+        fail_sharded_job(db, upload.job_id, message)
+    else:
+        db.execute(
+            update(Job)
+            .where(Job.job_id == upload.job_id, Job.status == "ingesting")
+            .values(status="error", error_message=message, completed_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+
+
+def ingest_next_upload():
+    """Claim and ingest the oldest pending upload; False when there is none"""
+    db = SessionLocal()
+    try:
+        claimed = claim_rows(
+            db, ResultUpload, ResultUpload.upload_id, 1,
+            dict(status="ingesting", started_at=datetime.now(), attempts=func.coalesce(ResultUpload.attempts, 0) + 1),
+            (ResultUpload.upload_id, ResultUpload.created_at),
+            ResultUpload.status == "pending"
+        )
+        if not claimed:
+            return False
+        upload_id = claimed[0].upload_id
+        upload = db.get(ResultUpload, upload_id)
+
+        try:
+            # Flagged up front so it commits together with the job/shard it completes
+            upload.status = "done"
+            upload.finished_at = datetime.now()
+            result = ingest_upload(db, upload)
+            upload.questions_received = result.get('questions_received', upload.questions_received)
+            upload.questions_saved = result.get('questions_count')
+            upload.rows_per_sec = result.get('rows_per_sec')
+            db.commit()
+            discard_spool(upload_id)
+            print(f"📥 Ingested {upload.questions_received} question(s) for job {upload.job_id}: {result}")
+        except Exception as e:
+            db.rollback()
+            upload = db.get(ResultUpload, upload_id)
+            upload.error_message = str(e)
+            if (upload.attempts or 0) >= INGEST_MAX_ATTEMPTS:
+                upload.status = "error"
+                upload.finished_at = datetime.now()
+                fail_ingest(db, upload)
+            else:
+                upload.status = "pending"
+            db.commit()
+            if upload.status == "error" and upload.shard_id:
+                discard_shard_results(upload.job_id)
+            print(f"❌ Ingest of job {upload.job_id} failed (attempt {upload.attempts}): {e}")
+
+        publish_job_events(db, [upload.job_id])
+        return True
     finally:
         db.close()
 
 
+def ingest_status(db, job_id):
+    """Latest upload of a job, plus how many of its uploads are still queued or running"""
+    uploads = db.query(ResultUpload).filter(ResultUpload.job_id == job_id).order_by(ResultUpload.created_at.desc()).all()
+    if not uploads:
+        return None
+    latest = uploads[0]
+    return {
+        'status': latest.status,
+        'upload_id': latest.upload_id,
+        'questions_received': latest.questions_received,
+        'questions_saved': latest.questions_saved,
+        'rows_per_sec': latest.rows_per_sec,
+        'attempts': latest.attempts or 0,
+        'error_message': latest.error_message,
+        'accepted_at': latest.created_at.isoformat() if latest.created_at else None,
+        'finished_at': latest.finished_at.isoformat() if latest.finished_at else None,
+        'pending': sum(u.status in ("pending", "ingesting") for u in uploads)
+    }
+
+
+def ingest_worker_loop():
+    seen = None
+    while True:
+        with ingest_pending:
+            ingest_pending.wait_for(lambda: ingest_pending_generation != seen, timeout=INGEST_IDLE_WAIT)
+            seen = ingest_pending_generation
+        try:
+            while ingest_next_upload():
+                pass
+        except Exception as e:
+            print(f"❌ Ingest worker error: {e}")
+            time.sleep(INGEST_RETRY_AFTER)
+
+
+def resume_interrupted_ingests():
+    """Uploads that were mid-ingest when the server stopped go back to pending"""
+    with engine.begin() as conn:
+        conn.execute(
+            update(ResultUpload.__table__)
+            .where(ResultUpload.status == "ingesting")
+            .values(status="pending")
+        )
+
+
+# ================================
+# Processor registry (heartbeats)
+# ================================
+# Heartbeats only touch this in-memory registry; a background flush writes the batch of
+# PCs heard from since the last flush to pc_processors (and renews their job/shard leases)
+# in one transaction every HEARTBEAT_FLUSH_INTERVAL seconds. A PC's state is derived from
+# the age of its last heartbeat: online, stale (missed a couple) or offline (its work is
+# requeued by the lease reaper).
+HEARTBEAT_FLUSH_INTERVAL = int(os.getenv('HEARTBEAT_FLUSH_INTERVAL', 10))
+PC_ONLINE_SECONDS = 60  # two missed 30s heartbeats
+THROUGHPUT_SMOOTHING = 0.3  # weight of the newest measurement in a PC's pages/min
+THROUGHPUT_HISTORY = 500  # recent completed jobs/shards used to seed throughput at startup
+
+processors = {}  # pc_id -> {'last_heartbeat', 'addresses', 'heartbeats', 'capabilities', 'pages_per_minute'}
+processors_dirty = set()
+processors_lock = threading.Lock()
+
+# Addresses each worker name (a pc_id, or the address of a PC polling without one) has
+# polled or sent heartbeats from; tells a lease holder's result upload from a stale PC's
+processor_addresses = {}  # name -> set of addresses
+
+
+def note_processor_address(name, address):
+    with processors_lock:
+        processor_addresses.setdefault(name, set()).add(address)
+
+
+def sent_by_lease_holder(leased_name, sender, address):
+    """Whether an upload from sender@address comes from the PC that holds the lease.
+
+    Without anything recorded for the lease holder (e.g. just after a restart) the upload is trusted.
+    """
+    if leased_name in (sender, address):
+        return True
+    with processors_lock:
+        known = processor_addresses.get(leased_name)
+        return not known or address in known
+
+
+def processor_state(last_heartbeat, now):
+    age = (now - last_heartbeat).total_seconds() if last_heartbeat else None
+    if age is not None and age <= PC_ONLINE_SECONDS:
+        return "online"
+    if age is not None and age <= HEARTBEAT_STALE_SECONDS:
+        return "stale"
+    return "offline"
+
+
+def new_processor(pc_id, last_heartbeat=None, capabilities=None, pages_per_minute=None):
+    return {
+        'last_heartbeat': last_heartbeat,
+        'addresses': {pc_id},
+        'heartbeats': 0,
+        'capabilities': capabilities or {},
+        'pages_per_minute': pages_per_minute
+    }
+
+
+def throughput_history(db):
+    """pages/min per PC over its most recent completed jobs and shards (processed_at -> completed_at)"""
+    pages, minutes = {}, {}
+    for model, page_count in ((Job, Job.page_count), (JobShard, JobShard.page_end - JobShard.page_start + 1)):
+        rows = db.execute(
+            select(model.pc_processor, page_count.label("pages"), model.processed_at, model.completed_at)
+            .where(model.status == "completed", model.pc_processor.isnot(None), model.processed_at.isnot(None),
+                   model.completed_at.isnot(None), page_count.isnot(None))
+            .order_by(model.completed_at.desc())
+            .limit(THROUGHPUT_HISTORY)
+        ).all()
+        for r in rows:
+            elapsed = (r.completed_at - r.processed_at).total_seconds() / 60
+            if elapsed > 0:
+                pages[r.pc_processor] = pages.get(r.pc_processor, 0) + r.pages
+                minutes[r.pc_processor] = minutes.get(r.pc_processor, 0) + elapsed
+    return {pc: pages[pc] / minutes[pc] for pc in pages}
+
+
+def load_processors():
+    db = SessionLocal()
+    try:
+        history = throughput_history(db)
+        with processors_lock:
+            for p in db.query(PCProcessor).all():
+                processors[p.pc_id] = new_processor(
+                    p.pc_id, p.last_heartbeat, parse_metadata(p.capabilities), p.pages_per_minute or history.get(p.pc_id)
+                )
+    finally:
+        db.close()
+
+
+def record_heartbeat(pc_id, address, capabilities=None, pages_per_minute=None):
+    with processors_lock:
+        proc = processors.setdefault(pc_id, new_processor(pc_id))
+        proc['last_heartbeat'] = datetime.now()
+        proc['addresses'].add(address)
+        processor_addresses.setdefault(pc_id, set()).add(address)
+        proc['heartbeats'] += 1
+        if capabilities is not None:
+            proc['capabilities'] = capabilities
+        if pages_per_minute and not proc['pages_per_minute']:
+            proc['pages_per_minute'] = pages_per_minute  # self-reported, until the server has measured it
+        processors_dirty.add(pc_id)
+
+
+def registry_entry_id(name):
+    """Registry key for a worker name; call with processors_lock held.
+
+    Jobs are leased under the poll's ?pc_id=, or the PC's address when it polls without
+    one, while the registry is keyed by the heartbeat's pc_id: match them through the
+    addresses both were seen from. None when unknown or ambiguous (PCs sharing an address).
+    """
+    if name in processors:
+        return name
+    names = {name} | processor_addresses.get(name, set())
+    matches = [pc_id for pc_id, proc in processors.items() if proc['addresses'] & names]
+    return matches[0] if len(matches) == 1 else None
+
+
+def registry_id(name):
+    with processors_lock:
+        return registry_entry_id(name)
+
+
+def record_throughput(pc_name, pages, started_at):
+    """Fold a finished job/shard into the PC's pages/min (called when its results arrive)"""
+    if not pages or not started_at:
+        return
+    minutes = max((datetime.now() - started_at).total_seconds(), 1) / 60
+    with processors_lock:
+        pc_id = registry_entry_id(pc_name)
+        if pc_id is None:
+            return  # only PCs that send heartbeats are scheduled
+        proc = processors[pc_id]
+        rate = pages / minutes
+        previous = proc['pages_per_minute']
+        proc['pages_per_minute'] = rate if not previous else (1 - THROUGHPUT_SMOOTHING) * previous + THROUGHPUT_SMOOTHING * rate
+        processors_dirty.add(pc_id)
+
+
+def processor_capabilities(pc_name):
+    with processors_lock:
+        pc_id = registry_entry_id(pc_name)
+        return dict(processors[pc_id]['capabilities']) if pc_id else {}
+
+
+def online_throughputs(now):
+    with processors_lock:
+        return {
+            pc_id: proc['pages_per_minute'] for pc_id, proc in processors.items()
+            if proc['pages_per_minute'] and processor_state(proc['last_heartbeat'], now) == "online"
+        }
+
+
+def stale_processor_ids(db, now):
+    """Every name (pc_id or address) a job may be leased under, for PCs past HEARTBEAT_STALE_SECONDS.
+
+    Staleness comes from the flushed pc_processors.last_heartbeat (allowing one flush interval
+    of lag), so a process whose registry is empty or behind never reaps a live PC's work; this
+    process's registry only adds heartbeats not flushed yet and the addresses a PC polls from.
+    """
+    last_seen = dict(db.execute(select(PCProcessor.pc_id, PCProcessor.last_heartbeat)).all())
+    names = {}
+    with processors_lock:
+        for pc_id, proc in processors.items():
+            names[pc_id] = set(proc['addresses'])
+            if proc['last_heartbeat'] and (not last_seen.get(pc_id) or proc['last_heartbeat'] > last_seen[pc_id]):
+                last_seen[pc_id] = proc['last_heartbeat']
+
+    cutoff = now - timedelta(seconds=HEARTBEAT_STALE_SECONDS + HEARTBEAT_FLUSH_INTERVAL)
+    stale, live = set(), set()
+    for pc_id, seen in last_seen.items():
+        (stale if not seen or seen < cutoff else live).update(names.get(pc_id, {pc_id}))
+    return stale - live  # PCs behind one address: a live one keeps the shared name alive
+
+
+def flush_heartbeats():
+    """Persist the heartbeats received since the last flush; returns how many PCs were written"""
+    with processors_lock:
+        batch = [
+            {
+                'pc_name': pc_id,
+                'seen_at': processors[pc_id]['last_heartbeat'],
+                'names': set(processors[pc_id]['addresses']),
+                'caps': json.dumps(processors[pc_id]['capabilities']),
+                'rate': processors[pc_id]['pages_per_minute']
+            }
+            for pc_id in processors_dirty
+        ]
+        processors_dirty.clear()
+    if not batch:
+        return 0
+
+    pc_table = PCProcessor.__table__
+    try:
+        with engine.begin() as conn:
+            existing = set(conn.execute(select(pc_table.c.pc_id).where(pc_table.c.pc_id.in_([b['pc_name'] for b in batch]))).scalars())
+            rows = [
+                {'pc_name': b['pc_name'], 'seen_at': b['seen_at'], 'caps': b['caps'], 'rate': b['rate']}
+                for b in batch if b['pc_name'] in existing
+            ]
+            if rows:
+                conn.execute(
+                    update(pc_table)
+                    .where(pc_table.c.pc_id == bindparam('pc_name'))
+                    .values(last_heartbeat=bindparam('seen_at'), status="online",
+                            capabilities=bindparam('caps'), pages_per_minute=bindparam('rate')),
+                    rows
+                )
+            new_rows = [
+                {'pc_id': b['pc_name'], 'last_heartbeat': b['seen_at'], 'status': "online",
+                 'capabilities': b['caps'], 'pages_per_minute': b['rate']}
+                for b in batch if b['pc_name'] not in existing
+            ]
+            if new_rows:
+                conn.execute(insert(pc_table), new_rows)
+
+            # Renew the leases on everything these PCs are working on
+            leases = [
+                {'pc_name': name, 'lease_until': b['seen_at'] + timedelta(seconds=JOB_LEASE_SECONDS)}
+                for b in batch for name in b['names']
+            ]
+            for model in (Job, JobShard):
+                tbl = model.__table__
+                renewal = {'lease_expires_at': bindparam('lease_until')}
+                if 'updated_at' in tbl.c:
+                    renewal['updated_at'] = tbl.c.updated_at  # a renewal is not a change /api/queue?since= should resend
+                conn.execute(
+                    update(tbl)
+                    .where(tbl.c.status == "processing", tbl.c.pc_processor == bindparam('pc_name'))
+                    .values(**renewal),
+                    leases
+                )
+
+            # The stored status is kept for older readers; the registry is authoritative
+            conn.execute(
+                update(pc_table)
+                .where(pc_table.c.status != "offline", pc_table.c.last_heartbeat < datetime.now() - timedelta(seconds=HEARTBEAT_STALE_SECONDS))
+                .values(status="offline")
+            )
+    except Exception:
+        with processors_lock:
+            processors_dirty.update(b['pc_name'] for b in batch)  # retried on the next flush
+        raise
+    return len(batch)
+
+
+def heartbeat_flush_loop():
+    while True:
+        time.sleep(HEARTBEAT_FLUSH_INTERVAL)
+        try:
+            flush_heartbeats()
+        except Exception as e:
+            print(f"❌ Heartbeat flush error: {e}")
+
+
+load_processors()
+
+
+@app.route('/api/heartbeat', methods=['POST'])
+def heartbeat():
+    """Body: pc_id, optional capabilities (e.g. {"gpu": "RTX 4090", "max_pages": 500}) and pages_per_minute"""
+    data = request.get_json(silent=True) or {}
+    capabilities = data.get('capabilities')
+    pages_per_minute = data.get('pages_per_minute')
+    record_heartbeat(
+        data.get('pc_id', request.remote_addr), request.remote_addr,
+        capabilities if isinstance(capabilities, dict) else None,
+        pages_per_minute if isinstance(pages_per_minute, (int, float)) and pages_per_minute > 0 else None
+    )
+    return jsonify({'message': 'Heartbeat received'})
+
+
 @app.route('/download/<filename>')
 def download_file(filename):
+    # Job files are stored by content hash; resolve the job's filename to its stored copy
+    db = SessionLocal()
+    try:
+        job = db.query(Job.filepath).filter(Job.filename == filename).first()
+    finally:
+        db.close()
+    if job and os.path.exists(job.filepath):
+        return send_file(os.path.abspath(job.filepath), as_attachment=True, download_name=filename)
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True)
 
 
@@ -600,19 +3369,109 @@ def upload_latex_image():
 
 @app.route('/api/pc_status')
 def pc_status():
-    db = SessionLocal()
-    try:
-        processors = db.query(PCProcessor).all()
-        return jsonify([
-            {
-                'pc_id': p.pc_id,
-                'last_heartbeat': p.last_heartbeat.isoformat() if p.last_heartbeat else None,
-                'status': p.status
-            } for p in processors
-        ])
-    finally:
-        db.close()
+    """Known PCs with their state (online / stale / offline) computed from the last heartbeat"""
+    now = datetime.now()
+    with processors_lock:
+        snapshot = [(pc_id, dict(proc)) for pc_id, proc in processors.items()]
+    return jsonify([
+        {
+            'pc_id': pc_id,
+            'last_heartbeat': proc['last_heartbeat'].isoformat() if proc['last_heartbeat'] else None,
+            'seconds_since_heartbeat': round((now - proc['last_heartbeat']).total_seconds()) if proc['last_heartbeat'] else None,
+            'status': processor_state(proc['last_heartbeat'], now),
+            'pages_per_minute': round(proc['pages_per_minute'], 2) if proc['pages_per_minute'] else None,
+            'capabilities': proc['capabilities']
+        } for pc_id, proc in sorted(snapshot)
+    ])
+
+
+# ================================
+# LEASE REAPER
+# ================================
+def requeue_expired_jobs(db):
+    """Requeue processing jobs/shards whose lease expired or whose PC stopped sending heartbeats.
+
+    Work that has already been leased MAX_JOB_ATTEMPTS times is failed instead.
+    Returns (requeued, failed).
+    """
+    now = datetime.now()
+    stale_pcs = stale_processor_ids(db, now)
+    give_up_message = f"Lease expired after {MAX_JOB_ATTEMPTS} attempts"
+    requeued = failed = 0
+    failed_sharded = set()
+
+    for model in (Job, JobShard):
+        abandoned = [
+            model.status == "processing",
+            or_(model.lease_expires_at < now, model.pc_processor.in_(stale_pcs))
+        ]
+        if model is Job:
+            abandoned.append(Job.shard_count.is_(None))  # sharded jobs are tracked per shard
+        exhausted = func.coalesce(model.attempts, 0) >= MAX_JOB_ATTEMPTS
+
+        if model is JobShard:
+            failed_sharded = set(db.execute(select(JobShard.job_id).where(*abandoned, exhausted)).scalars())
+            for job_id in failed_sharded:
+                fail_sharded_job(db, job_id, give_up_message)
+                failed += 1
+        else:
+            failed += db.execute(
+                update(Job)
+                .where(*abandoned, exhausted)
+                .values(status="error", error_message=give_up_message, completed_at=now, lease_expires_at=None)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+        requeued += db.execute(
+            update(model)
+            .where(*abandoned)
+            .values(status="queued", processed_at=None, pc_processor=None, lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    db.commit()
+    for job_id in failed_sharded:
+        discard_shard_results(job_id)
+
+    if requeued:
+        notify_jobs_queued()
+    if requeued or failed:
+        publish_job_events(db, db.execute(select(Job.job_id).where(Job.updated_at >= now)).scalars().all())
+    return requeued, failed
+
+
+def lease_reaper_loop():
+    while True:
+        time.sleep(LEASE_REAPER_INTERVAL)
+        db = SessionLocal()
+        try:
+            requeued, failed = requeue_expired_jobs(db)
+            if requeued or failed:
+                print(f"♻️ Lease reaper: requeued {requeued} job(s), failed {failed} job(s)")
+        except Exception as e:
+            print(f"❌ Lease reaper error: {e}")
+        finally:
+            db.close()
+
+
+# ================================
+# BACKGROUND THREADS
+# ================================
+def start_background_threads():
+    """Ingest workers, heartbeat flush, lease reaper and masters sync for the process that serves requests.
+
+    Not started on import: the Werkzeug reloader's watcher process imports this module too,
+    and its threads would act on an empty processor registry. Scripts that drive the app
+    in-process call this themselves.
+    """
+    resume_interrupted_ingests()
+    for n in range(INGEST_WORKERS):
+        threading.Thread(target=ingest_worker_loop, name=f"ingest-{n}", daemon=True).start()
+    threading.Thread(target=heartbeat_flush_loop, name="heartbeat-flush", daemon=True).start()
+    threading.Thread(target=lease_reaper_loop, name="lease-reaper", daemon=True).start()
+    if MASTERS_SYNC_INTERVAL:
+        threading.Thread(target=masters_sync_loop, name="masters-sync", daemon=True).start()
 
 
 if __name__ == '__main__':
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':  # the reloader's child serves; the parent only watches files
+        start_background_threads()
     app.run(debug=True, host='0.0.0.0', port=5002)
\ No newline at end of file